@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING
+
+from metrics import analysis_cache_events
+
+
+ANALYSIS_CACHE_TTL_SECONDS = int(os.environ.get('ANALYSIS_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 50000))
+
+
+
+def _normalize(value):
+    # Row order from Mongo is not stable, so lists are sorted by their JSON form
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        items = [_normalize(item) for item in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True, default=str))
+    return value
+
+
+def cache_key(student_data, prompt_version, model):
+    """Content hash of the analysis input plus the prompt and model versions."""
+    payload = json.dumps(
+        {"data": _normalize(student_data), "prompt_version": prompt_version, "model": model},
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def get_cached_analysis(collection, key):
+    now = datetime.now(timezone.utc)
+    entry = await collection.find_one_and_update(
+        {"key": key, "expires_at": {"$gt": now}},
+        {"$set": {"last_used_at": now}, "$inc": {"hit_count": 1}},
+        projection={"_id": 0, "response": 1},
+    )
+    if entry:
+        analysis_cache_events.inc(event="hits")
+        return entry["response"]
+    analysis_cache_events.inc(event="misses")
+    return None
+
+
+async def store_analysis(collection, key, response, student_id, prompt_version, model):
+    now = datetime.now(timezone.utc)
+    await collection.update_one(
+        {"key": key},
+        {
+            "$set": {
+                "response": response,
+                "student_id": student_id,
+                "prompt_version": prompt_version,
+                "model": model,
+                "last_used_at": now,
+                "expires_at": now + timedelta(seconds=ANALYSIS_CACHE_TTL_SECONDS),
+            },
+            "$setOnInsert": {"created_at": now, "hit_count": 0},
+        },
+        upsert=True,
+    )
+    analysis_cache_events.inc(event="stores")
+    await evict_lru(collection)
+
+
+async def evict_lru(collection, max_entries=ANALYSIS_CACHE_MAX_ENTRIES):
+    """Drop the least recently used entries beyond max_entries."""
+    excess = await collection.estimated_document_count() - max_entries
+    if excess <= 0:
+        return 0
+    stale = await collection.find({}, {"_id": 1}).sort("last_used_at", ASCENDING).limit(excess).to_list(excess)
+    result = await collection.delete_many({"_id": {"$in": [entry["_id"] for entry in stale]}})
+    analysis_cache_events.inc(result.deleted_count, event="evictions")
+    return result.deleted_count
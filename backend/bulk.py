@@ -0,0 +1,24 @@
+from pymongo.errors import BulkWriteError
+
+
+def chunked(items, size):
+    """Consecutive slices of `items`, each at most `size` long."""
+    return (items[start:start + size] for start in range(0, len(items), size))
+
+
+async def insert_chunks(collection, chunks):
+    """Insert document chunks with unordered insert_many; returns the inserted count.
+
+    Documents rejected by the server (e.g. duplicate keys) are skipped, the
+    rest of each chunk still goes in.
+    """
+    inserted = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        try:
+            result = await collection.insert_many(chunk, ordered=False)
+            inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            inserted += e.details.get("nInserted", 0)
+    return inserted
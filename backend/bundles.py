@@ -0,0 +1,263 @@
+import asyncio
+import io
+import os
+import time
+import zipfile
+from pathlib import PurePosixPath
+
+import pandas as pd
+from pymongo.errors import BulkWriteError
+
+from feature_store import update_features
+from ingest import (MAX_REPORTED_ERRORS, SCHEMAS, clean_frame, collect_write_errors, iter_record_chunks, iter_upload_frames,
+                    write_counts, write_ordered)
+from parsing import parse_executor
+
+
+# Upper bound on a bundle's uncompressed size, checked before anything is parsed
+BUNDLE_MAX_BYTES = int(os.environ.get('BUNDLE_MAX_BYTES', 200 * 1024 * 1024))
+BUNDLE_TRANSACTIONS = os.environ.get('BUNDLE_TRANSACTIONS', 'auto')  # auto, off
+# Larger bundles are written without a transaction, which would outlive
+# the server's transactionLifetimeLimitSeconds
+BUNDLE_TRANSACTION_MAX_ROWS = int(os.environ.get('BUNDLE_TRANSACTION_MAX_ROWS', 100000))
+# Students first, so every other sheet only references rows already written
+BUNDLE_ORDER = ("students", "attendance", "assessments", "fees")
+MEMBER_SUFFIXES = (".csv", ".xlsx", ".xlsm", ".xls")
+WORKBOOK_SUFFIXES = (".xlsx", ".xlsm", ".xls")
+STUDENT_LOOKUP_BATCH = 10000
+
+_transactions_supported = None
+
+
+class BundleError(ValueError):
+    pass
+
+
+def _schema_for(name):
+    stem = PurePosixPath(name).stem.lower().strip()
+    return stem if stem in SCHEMAS else None
+
+
+def bundle_parts(contents, filename):
+    """Locate each upload type in a bundle; runs on the parse executor.
+
+    A bundle is a .zip of students/attendance/assessments/fees files (.csv
+    or .xlsx, matched by file name) or one workbook with a sheet per type.
+    Returns ({schema_name: (kind, name)}, ignored names).
+    """
+    filename = (filename or "").lower()
+    is_workbook = filename.endswith(WORKBOOK_SUFFIXES)
+    if not filename.endswith(WORKBOOK_SUFFIXES + (".zip",)) and not zipfile.is_zipfile(io.BytesIO(contents)):
+        raise BundleError("Bundles must be a .zip archive or an Excel workbook")
+
+    if is_workbook:
+        with pd.ExcelFile(io.BytesIO(contents)) as workbook:
+            sources = [("sheet", name) for name in workbook.sheet_names]
+    else:
+        with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            # .xlsx files are zip archives themselves
+            if "[Content_Types].xml" in {info.filename for info in members}:
+                with pd.ExcelFile(io.BytesIO(contents)) as workbook:
+                    sources = [("sheet", name) for name in workbook.sheet_names]
+            else:
+                if sum(info.file_size for info in members) > BUNDLE_MAX_BYTES:
+                    raise BundleError(f"Bundle expands to more than {BUNDLE_MAX_BYTES} bytes")
+                sources = [("member", info.filename) for info in members
+                           if not PurePosixPath(info.filename).name.startswith(".")]
+
+    parts, ignored = {}, []
+    for kind, name in sources:
+        schema_name = _schema_for(name)
+        if schema_name is None or (kind == "member" and not name.lower().endswith(MEMBER_SUFFIXES)):
+            ignored.append(name)
+        elif schema_name in parts:
+            raise BundleError(f"Bundle has more than one {schema_name} file: {parts[schema_name][1]}, {name}")
+        else:
+            parts[schema_name] = (kind, name)
+    return parts, ignored
+
+
+def parse_part(contents, kind, name, schema_name, mode="insert"):
+    """Read and clean one sheet of a bundle; runs on the parse executor.
+
+    Returns (total_rows, clean frame, rejected, errors, duplicates).
+    """
+    if kind == "member":
+        with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+            data = archive.read(name)
+        df = pd.concat(list(iter_upload_frames(io.BytesIO(data), name, schema_name)))
+    else:
+        df = pd.read_excel(io.BytesIO(contents), sheet_name=name)
+    total_rows = len(df)
+    clean, rejected, errors, duplicates = clean_frame(df.dropna(how="all"), schema_name, mode)
+    return total_rows, clean, rejected, errors, duplicates
+
+
+def check_references(clean, schema_name, known_ids, existing_ids=(), mode="insert"):
+    """Reject rows that would break the bundle's student_id references.
+
+    Other sheets may only reference students in `known_ids`; inserted
+    students must be new and appear once. Runs on the parse executor and
+    returns (record chunks, rejected, errors).
+    """
+    student_ids = clean["student_id"]
+    if schema_name != "students":
+        problems = [(~student_ids.isin(known_ids), "unknown student_id")]
+    elif mode == "insert":
+        problems = [
+            (student_ids.duplicated(keep="first"), "duplicate student_id in bundle"),
+            (student_ids.isin(existing_ids), "student_id already exists"),
+        ]
+    else:
+        problems = []
+
+    invalid = pd.Series(False, index=clean.index)
+    errors = []
+    for rows, message in problems:
+        rows &= ~invalid
+        for idx in rows[rows].index[:max(MAX_REPORTED_ERRORS - len(errors), 0)]:
+            errors.append({"row": int(idx) + 2, "column": "student_id", "value": student_ids[idx], "error": message})
+        invalid |= rows
+    return list(iter_record_chunks(clean[~invalid])), int(invalid.sum()), errors
+
+
+async def _existing_student_ids(db, student_ids):
+    ids = list(student_ids)
+    existing = set()
+    for start in range(0, len(ids), STUDENT_LOOKUP_BATCH):
+        cursor = db.students.find({"student_id": {"$in": ids[start:start + STUDENT_LOOKUP_BATCH]}}, {"_id": 0, "student_id": 1})
+        existing.update([document["student_id"] async for document in cursor])
+    return existing
+
+
+async def transactions_supported(db):
+    """Whether the deployment runs multi-document transactions (replica set or sharded cluster)."""
+    global _transactions_supported
+    if BUNDLE_TRANSACTIONS == "off":
+        return False
+    if _transactions_supported is None:
+        try:
+            hello = await db.client.admin.command("hello")
+            _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _transactions_supported = False
+    return _transactions_supported
+
+
+def _add_counts(totals, counts):
+    for outcome, count in counts.items():
+        totals[outcome] = totals.get(outcome, 0) + count
+
+
+async def _write_parts(db, parts, mode, counts, written, session=None):
+    """Ordered writes of every sheet, in BUNDLE_ORDER, stopping at the first error.
+
+    Fills in per-sheet `counts` and appends (schema_name, chunk, additive)
+    to `written` as chunks go in, including the chunk that failed.
+    """
+    for schema_name, chunks in parts.items():
+        totals = counts.setdefault(schema_name, {})
+        for chunk in chunks:
+            try:
+                _add_counts(totals, await write_ordered(db[schema_name], chunk, schema_name, mode, session))
+            except BulkWriteError as e:
+                _add_counts(totals, write_counts(mode, details=e.details))
+                # Part of the chunk went in, so its students are recomputed
+                written.append((schema_name, chunk, False))
+                raise
+            written.append((schema_name, chunk, mode == "insert"))
+
+
+async def ingest_bundle(db, contents, filename, mode="insert"):
+    """Validate every sheet of a bundle before writing any of them.
+
+    Sheets are parsed concurrently on the parse executor. Rows whose
+    student_id is neither in the bundle's students sheet nor already
+    stored are rejected up front, then the rest is written students first
+    with ordered bulk writes, inside one transaction where the deployment
+    supports it. Without one, a failed write stops the bundle and the
+    result says so (status "partial").
+    """
+    started = time.perf_counter()
+    if len(contents) > BUNDLE_MAX_BYTES:
+        raise BundleError(f"Bundle is larger than {BUNDLE_MAX_BYTES} bytes")
+    sources, ignored = await parse_executor.run(bundle_parts, contents, filename)
+    if not sources:
+        raise BundleError(f"Bundle has no {', '.join(BUNDLE_ORDER)} files or sheets")
+    order = [schema_name for schema_name in BUNDLE_ORDER if schema_name in sources]
+    parsed = dict(zip(order, await asyncio.gather(*(
+        parse_executor.run(parse_part, contents, *sources[schema_name], schema_name, mode) for schema_name in order
+    ))))
+
+    # One hash set of student ids covers every reference in the bundle
+    bundle_ids = set(parsed["students"][1]["student_id"]) if "students" in parsed else set()
+    referenced = set()
+    for schema_name in order:
+        if schema_name != "students":
+            referenced.update(parsed[schema_name][1]["student_id"])
+    lookup = referenced - bundle_ids
+    if mode == "insert":
+        lookup |= bundle_ids
+    existing_ids = await _existing_student_ids(db, lookup)
+    known_ids = bundle_ids | existing_ids
+    checked = dict(zip(order, await asyncio.gather(*(
+        parse_executor.run(check_references, parsed[schema_name][1], schema_name, known_ids,
+                           existing_ids & bundle_ids, mode)
+        for schema_name in order
+    ))))
+
+    sheets = {}
+    for schema_name in order:
+        total_rows, _, rejected, errors, duplicates = parsed[schema_name]
+        _, unresolved, reference_errors = checked[schema_name]
+        sheets[schema_name] = {
+            "source": sources[schema_name][1],
+            "total_rows": total_rows,
+            "rejected": rejected + unresolved,
+            "key_errors": unresolved,
+            "errors": (errors + reference_errors)[:MAX_REPORTED_ERRORS],
+        }
+        if mode == "upsert":
+            sheets[schema_name]["duplicates"] = duplicates
+    parts = {schema_name: checked[schema_name][0] for schema_name in order}
+
+    rows = sum(len(chunk) for chunks in parts.values() for chunk in chunks)
+    transaction = rows <= BUNDLE_TRANSACTION_MAX_ROWS and await transactions_supported(db)
+    counts, written = {}, []
+    status, detail = "completed", None
+    if transaction:
+        # Any error aborts the transaction and propagates, so nothing is written
+        async with await db.client.start_session() as session:
+            async with session.start_transaction():
+                await _write_parts(db, parts, mode, counts, written, session)
+    else:
+        try:
+            await _write_parts(db, parts, mode, counts, written)
+        except BulkWriteError as e:
+            # Ordered writes stop at the failing row; everything before it stays
+            schema_name, chunk, _ = written[-1]
+            collect_write_errors(e, chunk, sheets[schema_name]["errors"])
+            status, detail = "partial", f"Stopped writing {schema_name}: {e}"
+
+    # The feature store only sees rows once they are committed
+    for schema_name, chunk, additive in written:
+        await update_features(db, schema_name, chunk, additive)
+    for schema_name in order:
+        sheets[schema_name].update({"inserted": 0, **counts.get(schema_name, {})})
+
+    elapsed = time.perf_counter() - started
+    total_rows = sum(sheet["total_rows"] for sheet in sheets.values())
+    return {
+        "status": status,
+        "detail": detail,
+        "mode": mode,
+        "transaction": transaction,
+        "total_rows": total_rows,
+        "inserted": sum(sheet["inserted"] for sheet in sheets.values()),
+        "rejected": sum(sheet["rejected"] for sheet in sheets.values()),
+        "sheets": sheets,
+        "ignored": ignored,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(total_rows / elapsed, 1) if elapsed > 0 else None,
+    }
@@ -0,0 +1,124 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument, UpdateOne
+
+
+# Single document in db.dashboard_stats holding the overview counters
+STATS_ID = "overview"
+RISK_LEVELS = ("HIGH", "MEDIUM", "LOW")
+# Risk level transitions applied at once by apply_risk_levels
+TRANSITION_CONCURRENCY = 50
+
+
+def stats_increment(**deltas):
+    """Update document for an incremental change, e.g. total_students=3.
+
+    Callers apply it without upsert: if the document is missing the next
+    read rebuilds it from scratch, so partial counters are never created.
+    """
+    return {
+        "$inc": {field: value for field, value in deltas.items() if value},
+        "$set": {"updated_at": datetime.now(timezone.utc)},
+    }
+
+
+async def increment_stats(db, **deltas):
+    if any(deltas.values()):
+        await db.dashboard_stats.update_one({"_id": STATS_ID}, stats_increment(**deltas))
+
+
+async def apply_risk_levels(db, assessments):
+    """Move students between risk buckets after new assessments are written.
+
+    Each student's current level is kept on the student document as
+    current_risk_level, so the distribution counts students, not the
+    history of assessments. Each change is a find_one_and_update that
+    returns the level it replaced, so concurrent analyses of one student
+    never both count the same transition.
+
+    Returns {student_id: (previous level or None, new level)} for the
+    students this call actually moved.
+    """
+    latest = {}
+    for assessment in assessments:
+        latest[assessment["student_id"]] = assessment["risk_level"]
+    if not latest:
+        return {}
+
+    # Cheap read to skip students whose level is unchanged; the updates re-check atomically
+    changed = [
+        (student["student_id"], latest[student["student_id"]])
+        async for student in db.students.find(
+            {"student_id": {"$in": list(latest)}}, {"_id": 0, "student_id": 1, "current_risk_level": 1}
+        )
+        if student.get("current_risk_level") != latest[student["student_id"]]
+    ]
+
+    async def transition(student_id, level):
+        before = await db.students.find_one_and_update(
+            {"student_id": student_id, "current_risk_level": {"$ne": level}},
+            {"$set": {"current_risk_level": level}},
+            projection={"_id": 0, "student_id": 1, "current_risk_level": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+        # None: another writer already moved the student to this level
+        return None if before is None else (student_id, before.get("current_risk_level"), level)
+
+    deltas = Counter()
+    transitions = {}
+    for start in range(0, len(changed), TRANSITION_CONCURRENCY):
+        batch = changed[start:start + TRANSITION_CONCURRENCY]
+        for moved in await asyncio.gather(*(transition(student_id, level) for student_id, level in batch)):
+            if moved is None:
+                continue
+            student_id, old, level = moved
+            transitions[student_id] = (old, level)
+            if old:
+                deltas[f"risk_distribution.{old.lower()}"] -= 1
+            deltas[f"risk_distribution.{level.lower()}"] += 1
+    await increment_stats(db, **deltas)
+    return transitions
+
+
+async def rebuild_stats(db):
+    """Recompute the counters from the source collections.
+
+    Backfills students.current_risk_level from each student's latest
+    assessment (db.risk_latest), then counts everything with one $facet
+    over students.
+    """
+    latest = db.risk_latest.find({}, {"_id": 0, "student_id": 1, "risk_level": 1})
+    updates = []
+    async for row in latest:
+        updates.append(UpdateOne({"student_id": row["student_id"]}, {"$set": {"current_risk_level": row["risk_level"]}}))
+        if len(updates) >= 1000:
+            await db.students.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await db.students.bulk_write(updates, ordered=False)
+
+    facets = await db.students.aggregate([{"$facet": {
+        "total": [{"$count": "count"}],
+        "levels": [{"$group": {"_id": "$current_risk_level", "count": {"$sum": 1}}}],
+    }}]).to_list(1)
+    facet = facets[0] if facets else {"total": [], "levels": []}
+    levels = {row["_id"]: row["count"] for row in facet["levels"]}
+
+    stats = {
+        "total_students": facet["total"][0]["count"] if facet["total"] else 0,
+        "risk_distribution": {level.lower(): levels.get(level, 0) for level in RISK_LEVELS},
+        "unread_notifications": await db.notifications.count_documents({"is_read": False}),
+        "updated_at": datetime.now(timezone.utc),
+        "rebuilt_at": datetime.now(timezone.utc),
+    }
+    await db.dashboard_stats.replace_one({"_id": STATS_ID}, stats, upsert=True)
+    return {"_id": STATS_ID, **stats}
+
+
+async def get_stats(db):
+    stats = await db.dashboard_stats.find_one({"_id": STATS_ID})
+    if stats is None:
+        stats = await rebuild_stats(db)
+    return stats
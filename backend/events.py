@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import uuid
+from collections import deque
+
+from fastapi.encoders import jsonable_encoder
+
+
+EVENT_BUFFER_SIZE = int(os.environ.get('EVENT_BUFFER_SIZE', 1000))
+EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', 500))
+EVENT_KEEPALIVE_SECONDS = float(os.environ.get('EVENT_KEEPALIVE_SECONDS', 15))
+
+_CLOSED = object()
+
+
+def format_event(event_id, event_type, data):
+    payload = json.dumps(jsonable_encoder(data), separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+
+class _Subscriber:
+    def __init__(self, queue_size, event_types):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.event_types = event_types
+        # Set when the client fell too far behind; its stream ends once drained
+        self.overflowed = False
+
+    def wants(self, event_type):
+        return not self.event_types or event_type in self.event_types
+
+    def offer(self, item):
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            self.overflowed = True
+            return False
+
+
+class EventBroker:
+    """In-process pub/sub for the /api/events stream.
+
+    Event ids are "<boot id>-<sequence>". The last EVENT_BUFFER_SIZE events
+    are kept so a client reconnecting with Last-Event-ID gets what it
+    missed; if its id is from another process or has left the buffer it
+    gets a "reset" event and should reload its lists. A client too slow to
+    keep up has its stream ended and resumes the same way.
+    """
+
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE, queue_size=EVENT_QUEUE_SIZE):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self.buffer = deque(maxlen=buffer_size)
+        self.queue_size = queue_size
+        self.subscribers = set()
+
+    def publish(self, event_type, data):
+        self.sequence += 1
+        event = (f"{self.boot_id}-{self.sequence}", event_type, data)
+        self.buffer.append(event)
+        for subscriber in list(self.subscribers):
+            if subscriber.wants(event_type) and not subscriber.offer(event):
+                self.subscribers.discard(subscriber)
+
+    def _missed(self, last_event_id):
+        """Buffered events after last_event_id, or None if they cannot be replayed."""
+        boot_id, _, sequence = (last_event_id or "").partition("-")
+        if boot_id != self.boot_id or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        if sequence + 1 < self.sequence - len(self.buffer) + 1:
+            return None
+        return [event for event in self.buffer if int(event[0].rsplit("-", 1)[1]) > sequence]
+
+    async def stream(self, last_event_id=None, event_types=None, keepalive=EVENT_KEEPALIVE_SECONDS):
+        """SSE-formatted chunks: missed events first, then live ones."""
+        subscriber = _Subscriber(self.queue_size, event_types)
+        # Subscribe before replaying so nothing published in between is lost
+        self.subscribers.add(subscriber)
+        try:
+            # Tell the browser how long to wait before reconnecting
+            yield "retry: 3000\n\n"
+            replayed = self.sequence
+            if last_event_id:
+                missed = self._missed(last_event_id)
+                if missed is None:
+                    yield format_event(f"{self.boot_id}-{self.sequence}", "reset", {"reason": "resume point no longer available"})
+                    missed = []
+                for event_id, event_type, data in missed:
+                    if subscriber.wants(event_type):
+                        yield format_event(event_id, event_type, data)
+
+            while not (subscriber.overflowed and subscriber.queue.empty()):
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is _CLOSED:
+                    return
+                event_id, event_type, data = event
+                # Already sent as part of the replay
+                if last_event_id and int(event_id.rsplit("-", 1)[1]) <= replayed:
+                    continue
+                yield format_event(event_id, event_type, data)
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def close(self):
+        for subscriber in list(self.subscribers):
+            subscriber.offer(_CLOSED)
+        self.subscribers.clear()
+
+
+event_broker = EventBroker()
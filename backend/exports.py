@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from bson import ObjectId
+
+from ingest import SCHEMAS, TIMESTAMPED
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # exports are unavailable without pyarrow
+    pa = ipc = pq = None
+
+
+# Outside the source tree by default; point at persistent storage to keep exports across restarts
+EXPORT_DIR = Path(os.environ.get('EXPORT_DIR', Path(tempfile.gettempdir()) / 'edupredict-exports'))
+# Rows per Parquet row group / Arrow record batch; also the most rows held in memory
+EXPORT_BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', 50000))
+# Incremental exports start this far before the watermark so rows written
+# while the previous export ran are not missed; consumers keep the last row per id
+EXPORT_WATERMARK_OVERLAP_SECONDS = int(os.environ.get('EXPORT_WATERMARK_OVERLAP_SECONDS', 60))
+EXPORT_MAX_CONCURRENT = int(os.environ.get('EXPORT_MAX_CONCURRENT', 2))
+EXPORT_COLLECTIONS = tuple(SCHEMAS)
+EXPORT_FORMATS = {
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+
+logger = logging.getLogger(__name__)
+
+_export_slots = None
+_running_tasks = set()
+
+ARROW_TYPES = {"str": "string", "int": "int64", "float": "float64", "datetime": "timestamp"}
+
+
+def export_available():
+    return pa is not None
+
+
+def export_schema(collection_name):
+    """Arrow schema of an export: the upload columns plus id and timestamps."""
+    columns = [("id", "str")] + [(name, kind) for name, kind, _ in SCHEMAS[collection_name]]
+    if collection_name in TIMESTAMPED:
+        columns.append((TIMESTAMPED[collection_name], "datetime"))
+    columns.append(("updated_at", "datetime"))
+    return pa.schema([
+        (name, pa.timestamp("us", tz="UTC") if kind == "datetime" else pa.type_for_alias(ARROW_TYPES[kind]))
+        for name, kind in columns
+    ])
+
+
+class _BatchWriter:
+    """Parquet or Arrow IPC file written one record batch at a time."""
+
+    def __init__(self, path, schema, output_format):
+        self.schema = schema
+        if output_format == "parquet":
+            self.writer = pq.ParquetWriter(path, schema, compression="zstd")
+        else:
+            self.writer = ipc.new_file(str(path), schema, options=ipc.IpcWriteOptions(compression="zstd"))
+        self.output_format = output_format
+
+    def write(self, rows):
+        batch = pa.RecordBatch.from_pylist(rows, schema=self.schema)
+        if self.output_format == "parquet":
+            self.writer.write_batch(batch, row_group_size=len(rows))
+        else:
+            self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+
+
+def _as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value is not None and value.tzinfo is None else value
+
+
+def _export_query(since):
+    if since is None:
+        return {}
+    # New rows by insertion time (in the ObjectId), upserted ones by updated_at
+    return {"$or": [{"_id": {"$gte": ObjectId.from_datetime(since)}}, {"updated_at": {"$gte": since}}]}
+
+
+async def run_export(db, export_id, collection_name, output_format, incremental, batch_rows=EXPORT_BATCH_ROWS):
+    exports = db.exports
+    started = time.perf_counter()
+    started_at = datetime.now(timezone.utc)
+    since = None
+    if incremental:
+        previous = await db.export_watermarks.find_one({"_id": f"{collection_name}:{output_format}"})
+        if previous is not None:
+            since = _as_utc(previous["watermark"]) - timedelta(seconds=EXPORT_WATERMARK_OVERLAP_SECONDS)
+
+    extension, _ = EXPORT_FORMATS[output_format]
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    filename = f"{collection_name}-{started_at:%Y%m%dT%H%M%SZ}-{'incremental' if since else 'full'}-{export_id[:8]}.{extension}"
+    path = EXPORT_DIR / filename
+    partial_path = path.with_suffix(path.suffix + ".part")
+    await exports.update_one({"id": export_id}, {"$set": {
+        "status": "running", "started_at": started_at, "since": since, "filename": filename,
+    }})
+
+    schema = export_schema(collection_name)
+    projection = {"_id": 0, **{name: 1 for name in schema.names}}
+    rows_written, batches, writer = 0, 0, None
+    try:
+        writer = await asyncio.to_thread(_BatchWriter, partial_path, schema, output_format)
+        cursor = db[collection_name].find(_export_query(since), projection).batch_size(min(batch_rows, 10000))
+        rows = []
+        async for document in cursor:
+            rows.append(document)
+            if len(rows) >= batch_rows:
+                # Arrow conversion and compression run off the event loop
+                await asyncio.to_thread(writer.write, rows)
+                rows_written += len(rows)
+                batches += 1
+                rows = []
+                await exports.update_one({"id": export_id}, {"$set": {"rows": rows_written}})
+        if rows:
+            await asyncio.to_thread(writer.write, rows)
+            rows_written += len(rows)
+            batches += 1
+        await asyncio.to_thread(writer.close)
+        writer = None
+        partial_path.replace(path)
+        status, detail = "completed", None
+    except Exception as e:
+        logger.exception("Export %s failed", export_id)
+        status, detail = "failed", str(e)
+        if writer is not None:
+            await asyncio.to_thread(writer.close)
+        partial_path.unlink(missing_ok=True)
+
+    result = {
+        "status": status,
+        "detail": detail,
+        "rows": rows_written,
+        "batches": batches,
+        "bytes": path.stat().st_size if status == "completed" else None,
+        "finished_at": datetime.now(timezone.utc),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+    await exports.update_one({"id": export_id}, {"$set": result})
+    if status == "completed":
+        # The next incremental export picks up from when this one started
+        await db.export_watermarks.replace_one(
+            {"_id": f"{collection_name}:{output_format}"},
+            {"watermark": started_at, "export_id": export_id},
+            upsert=True,
+        )
+    return status
+
+
+async def _run_export_job(db, export_id, *args):
+    global _export_slots
+    if _export_slots is None:
+        _export_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENT)
+    async with _export_slots:
+        await run_export(db, export_id, *args)
+
+
+def submit_export(db, export_id, collection_name, output_format="parquet", incremental=False):
+    """Run an export in the background; at most EXPORT_MAX_CONCURRENT at once."""
+    task = asyncio.create_task(_run_export_job(db, export_id, collection_name, output_format, incremental))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+    return task
+
+
+def export_file(export):
+    """Path and media type of a completed export's file, or None if it is gone."""
+    if export.get("status") != "completed" or not export.get("filename"):
+        return None
+    path = EXPORT_DIR / export["filename"]
+    if not path.is_file():
+        return None
+    return path, EXPORT_FORMATS[export["format"]][1]
@@ -0,0 +1,235 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+from pymongo import ReplaceOne, UpdateOne
+
+from parsing import parse_executor
+from risk_engine import STAT_GROUPS, features_from_stats, stats_from_summary, summarize_rows
+
+
+# db.student_features holds one document per student with the summed
+# statistics from risk_engine.summarize_rows; features are derived on read.
+FEATURE_SOURCES = ("attendance", "assessments", "fees")
+REFRESH_BATCH_SIZE = 1000
+
+SOURCE_PROJECTIONS = {
+    "attendance": {"_id": 0, "student_id": 1, "attendance_percentage": 1},
+    "assessments": {"_id": 0, "student_id": 1, "subject": 1, "percentage": 1, "date": 1, "attempt_number": 1},
+    "fees": {"_id": 0, "student_id": 1, "amount_due": 1, "amount_paid": 1, "due_date": 1, "paid_date": 1, "status": 1},
+}
+
+
+def _subject_field(subject):
+    # Subjects become keys of subject_attempts, so they must be valid field names
+    return str(subject).replace(".", "_").replace("$", "_") or "_"
+
+
+def _native(value):
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value.item() if hasattr(value, "item") else value
+
+
+def _unpaid_by_student(summary):
+    unpaid = {}
+    frame = summary.get("fees_unpaid")
+    if frame is not None:
+        for row in frame.to_dict("records"):
+            unpaid.setdefault(row["student_id"], []).append({
+                "due_date": _native(row["due_date"]) if pd.notna(row["due_date"]) else None,
+                "amount": float(row["amount"]),
+            })
+    return unpaid
+
+
+def delta_operations(summary):
+    """Upserts that add a summary of newly inserted rows onto stored statistics."""
+    updates = {}
+
+    def update(student_id):
+        return updates.setdefault(student_id, {"$inc": {}, "$min": {}, "$max": {}, "$push": {}})
+
+    for group in STAT_GROUPS:
+        if group not in summary:
+            continue
+        for student_id, row in summary[group].to_dict("index").items():
+            for column, value in row.items():
+                if pd.isna(value):
+                    continue
+                operator = {"attendance_min": "$min", "max_attempt": "$max"}.get(column, "$inc")
+                update(student_id)[operator][column] = _native(value)
+    for (student_id, subject), attempt in summary.get("subject_attempts", pd.Series(dtype="float64")).items():
+        update(student_id)["$max"][f"subject_attempts.{_subject_field(subject)}"] = _native(attempt)
+    for student_id, unpaid in _unpaid_by_student(summary).items():
+        update(student_id)["$push"]["fees_unpaid"] = {"$each": unpaid}
+
+    now = datetime.now(timezone.utc)
+    return [
+        UpdateOne(
+            {"student_id": student_id},
+            {**{operator: fields for operator, fields in ops.items() if fields}, "$set": {"updated_at": now}},
+            upsert=True,
+        )
+        for student_id, ops in updates.items()
+    ]
+
+
+def feature_documents(summary, student_ids):
+    """Complete student_features documents for `student_ids`, rows or not."""
+    now = datetime.now(timezone.utc)
+    documents = {
+        student_id: {"student_id": student_id, "subject_attempts": {}, "fees_unpaid": [], "updated_at": now}
+        for student_id in student_ids
+    }
+    for group in STAT_GROUPS:
+        if group not in summary:
+            continue
+        for student_id, row in summary[group].to_dict("index").items():
+            # Missing min/max fields (not null) so a later $min/$max sets them
+            documents[student_id].update({column: _native(value) for column, value in row.items() if pd.notna(value)})
+    for (student_id, subject), attempt in summary.get("subject_attempts", pd.Series(dtype="float64")).items():
+        documents[student_id]["subject_attempts"][_subject_field(subject)] = _native(attempt)
+    for student_id, unpaid in _unpaid_by_student(summary).items():
+        documents[student_id]["fees_unpaid"] = unpaid
+    return documents
+
+
+def summary_from_documents(documents):
+    """Inverse of feature_documents: stored documents back into summary form."""
+    frame = pd.DataFrame(documents)
+    if frame.empty:
+        return {}
+    frame = frame.set_index("student_id")
+    summary = {group: frame.reindex(columns=columns) for group, columns in STAT_GROUPS.items()}
+    attempts = [
+        (document["student_id"], subject, attempt)
+        for document in documents
+        for subject, attempt in (document.get("subject_attempts") or {}).items()
+    ]
+    if attempts:
+        summary["subject_attempts"] = pd.DataFrame(
+            attempts, columns=["student_id", "subject", "attempt"]
+        ).set_index(["student_id", "subject"])["attempt"]
+    unpaid = [
+        {"student_id": document["student_id"], **entry}
+        for document in documents
+        for entry in document.get("fees_unpaid") or []
+    ]
+    if unpaid:
+        summary["fees_unpaid"] = pd.DataFrame(unpaid)
+    return summary
+
+
+def _replace_operations(summary, student_ids):
+    return [
+        ReplaceOne({"student_id": student_id}, document, upsert=True)
+        for student_id, document in feature_documents(summary, student_ids).items()
+    ]
+
+
+def _refresh_batches(student_ids):
+    """Batches of `student_ids` with the find() arguments of their raw rows, per source.
+
+    Shared by refresh_features (Motor) and update_features_sync (pymongo),
+    which only differ in how they run the finds.
+    """
+    student_ids = sorted({str(student_id) for student_id in student_ids if student_id is not None})
+    for start in range(0, len(student_ids), REFRESH_BATCH_SIZE):
+        batch = student_ids[start:start + REFRESH_BATCH_SIZE]
+        query = {"student_id": {"$in": batch}}
+        yield batch, {source: (query, projection) for source, projection in SOURCE_PROJECTIONS.items()}
+
+
+def refresh_operations(rows, student_ids):
+    """Replacements of the stored statistics of `student_ids` from their raw rows, per source."""
+    frames = {source: pd.DataFrame(documents) for source, documents in rows.items()}
+    return _replace_operations(summarize_rows(**frames), student_ids)
+
+
+async def refresh_features(db, student_ids):
+    """Recompute the stored statistics of `student_ids` from their raw rows."""
+    refreshed = 0
+    for batch, finds in _refresh_batches(student_ids):
+        rows = {source: await db[source].find(*find).to_list(None) for source, find in finds.items()}
+        operations = await parse_executor.run(refresh_operations, rows, batch)
+        await db.student_features.bulk_write(operations, ordered=False)
+        refreshed += len(batch)
+    return refreshed
+
+
+def batch_operations(schema_name, records):
+    """delta_operations for one written batch of `schema_name` rows."""
+    return delta_operations(summarize_rows(**{schema_name: pd.DataFrame(records)}))
+
+
+async def update_features(db, schema_name, records, additive=True):
+    """Fold one written batch of `schema_name` rows into the feature store.
+
+    Fully inserted batches are added onto the stored sums; upserts (which
+    may overwrite rows already counted) and partly failed inserts recompute
+    the affected students instead.
+    """
+    if schema_name not in FEATURE_SOURCES or not records:
+        return
+    if not additive:
+        await refresh_features(db, [record.get("student_id") for record in records])
+        return
+    operations = await parse_executor.run(batch_operations, schema_name, records)
+    if operations:
+        await db.student_features.bulk_write(operations, ordered=False)
+
+
+def update_features_sync(db, schema_name, records, additive=True):
+    """pymongo version of update_features for the ingest worker processes."""
+    if schema_name not in FEATURE_SOURCES or not records:
+        return
+    if additive:
+        operations = batch_operations(schema_name, records)
+        if operations:
+            db.student_features.bulk_write(operations, ordered=False)
+        return
+    for batch, finds in _refresh_batches(record.get("student_id") for record in records):
+        rows = {source: list(db[source].find(*find)) for source, find in finds.items()}
+        db.student_features.bulk_write(refresh_operations(rows, batch), ordered=False)
+
+
+async def rebuild_features(db):
+    """Recompute the whole store, e.g. after rows were edited outside the API."""
+    student_ids = set(await db.students.distinct("student_id"))
+    for source in FEATURE_SOURCES:
+        student_ids.update(await db[source].distinct("student_id"))
+    refreshed = await refresh_features(db, student_ids)
+    result = await db.student_features.delete_many({"student_id": {"$nin": list(student_ids)}})
+    return {"refreshed": refreshed, "removed": result.deleted_count}
+
+
+async def load_features(db, student_ids, now=None):
+    """Feature frame (indexed by student_id) read from the store in one query."""
+    index = pd.Index([str(student_id) for student_id in student_ids], name="student_id").unique()
+    documents = await db.student_features.find(
+        {"student_id": {"$in": list(index)}}, {"_id": 0, "updated_at": 0}
+    ).to_list(None)
+    return features_from_stats(stats_from_summary(summary_from_documents(documents), index, now))
+
+
+async def ensure_features(db):
+    """Build the store once for data that predates it; no-op afterwards."""
+    if await db.student_features.estimated_document_count():
+        return None
+    for source in FEATURE_SOURCES:
+        if await db[source].estimated_document_count():
+            return await rebuild_features(db)
+    return None
+
+
+async def feature_report(db, student_id, now=None):
+    """Stored statistics plus the derived features of one student, or None."""
+    document = await db.student_features.find_one({"student_id": student_id}, {"_id": 0})
+    if document is None:
+        return None
+    features = features_from_stats(stats_from_summary(summary_from_documents([document]), pd.Index([student_id], name="student_id"), now))
+    derived = {
+        name: None if pd.isna(value) else _native(value)
+        for name, value in features.iloc[0].items()
+    }
+    return {**document, "features": derived}
@@ -0,0 +1,134 @@
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+
+logger = logging.getLogger(__name__)
+
+# Every index the backend relies on, per collection. Names are explicit so
+# re-running the bootstrap is a no-op and the admin report can match them up.
+INDEXES = {
+    "students": [
+        IndexModel([("student_id", ASCENDING)], name="student_id_unique", unique=True),
+        IndexModel([("course", ASCENDING), ("semester", ASCENDING)], name="course_semester"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at", sparse=True),
+    ],
+    "attendance": [
+        IndexModel([("student_id", ASCENDING), ("subject", ASCENDING), ("year", ASCENDING), ("month", ASCENDING)],
+                   name="student_subject_period"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at", sparse=True),
+    ],
+    "assessments": [
+        IndexModel([("student_id", ASCENDING), ("date", ASCENDING)], name="student_date"),
+        IndexModel([("student_id", ASCENDING), ("subject", ASCENDING), ("attempt_number", ASCENDING)],
+                   name="student_subject_attempt"),
+        # Natural key used by upsert ingest
+        IndexModel([("student_id", ASCENDING), ("subject", ASCENDING), ("assessment_type", ASCENDING),
+                    ("date", ASCENDING), ("attempt_number", ASCENDING)], name="natural_key"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at", sparse=True),
+    ],
+    "fees": [
+        IndexModel([("student_id", ASCENDING), ("due_date", ASCENDING)], name="student_due_date"),
+        IndexModel([("student_id", ASCENDING), ("semester", ASCENDING), ("due_date", ASCENDING)], name="natural_key"),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at", sparse=True),
+    ],
+    "risk_assessments": [
+        IndexModel([("student_id", ASCENDING), ("assessment_date", DESCENDING)], name="student_assessment_date"),
+        IndexModel([("risk_level", ASCENDING), ("assessment_date", DESCENDING)], name="risk_level_assessment_date"),
+        IndexModel([("assessment_date", DESCENDING)], name="assessment_date"),
+    ],
+    "risk_latest": [
+        IndexModel([("student_id", ASCENDING)], name="student_id_unique", unique=True),
+        IndexModel([("risk_level", ASCENDING), ("assessment_date", DESCENDING), ("student_id", ASCENDING)],
+                   name="risk_level_assessment_date"),
+        IndexModel([("risk_level", ASCENDING), ("risk_score", DESCENDING), ("student_id", ASCENDING)],
+                   name="risk_level_risk_score"),
+        IndexModel([("id", ASCENDING)], name="id"),
+    ],
+    "risk_history": [
+        IndexModel([("student_id", ASCENDING), ("bucket", ASCENDING)], name="student_bucket_unique", unique=True),
+    ],
+    "notifications": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("is_read", ASCENDING), ("priority", ASCENDING)], name="is_read_priority"),
+    ],
+    "student_features": [
+        IndexModel([("student_id", ASCENDING)], name="student_id_unique", unique=True),
+    ],
+    "response_cache": [
+        # Only used with RESPONSE_CACHE_BACKEND=mongo; tag generations have no expires_at and stay
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "exports": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+    ],
+    "ingest_jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+    ],
+    "analysis_cache": [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+        # Mongo's TTL monitor drops entries once expires_at has passed
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        IndexModel([("last_used_at", ASCENDING)], name="last_used_at"),
+    ],
+}
+
+# Outcome of the last bootstrap, keyed by "collection.index_name"
+bootstrap_results = {}
+
+
+async def ensure_indexes(db):
+    """Create all declared indexes; safe to run on every startup.
+
+    Each index is created on its own so one failure (e.g. duplicate
+    student_ids blocking the unique index) does not stop the others.
+    """
+    for collection_name, models in INDEXES.items():
+        for model in models:
+            name = model.document["name"]
+            try:
+                await db[collection_name].create_indexes([model])
+                bootstrap_results[f"{collection_name}.{name}"] = "ok"
+            except OperationFailure as e:
+                bootstrap_results[f"{collection_name}.{name}"] = f"failed: {e}"
+                logger.warning("Could not create index %s on %s: %s", name, collection_name, e)
+    return bootstrap_results
+
+
+async def index_report(db):
+    """Declared vs existing indexes with $indexStats usage counters."""
+    report = {}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        try:
+            stats = await collection.aggregate([{"$indexStats": {}}]).to_list(None)
+            usage = {
+                entry["name"]: {"ops": entry["accesses"]["ops"], "since": entry["accesses"]["since"].isoformat()}
+                for entry in stats
+            }
+        except OperationFailure:
+            usage = {}
+
+        report[collection_name] = {
+            "indexes": [
+                {
+                    "name": name,
+                    "key": [[field, direction] for field, direction in info["key"]],
+                    "unique": info.get("unique", False),
+                    "declared": any(model.document["name"] == name for model in models),
+                    "usage": usage.get(name),
+                }
+                for name, info in existing.items()
+            ],
+            "missing": [
+                {"name": model.document["name"], "status": bootstrap_results.get(f"{collection_name}.{model.document['name']}")}
+                for model in models if model.document["name"] not in existing
+            ],
+        }
+    return report
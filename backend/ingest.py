@@ -0,0 +1,443 @@
+import asyncio
+import io
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import pandas as pd
+from openpyxl import load_workbook
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from parsing import parse_executor
+
+
+INGEST_CHUNK_SIZE = int(os.environ.get('INGEST_CHUNK_SIZE', 5000))
+MAX_REPORTED_ERRORS = int(os.environ.get('INGEST_MAX_REPORTED_ERRORS', 100))
+STREAM_BATCH_SIZE = int(os.environ.get('INGEST_STREAM_BATCH_SIZE', 2000))
+MAX_TRACKED_UPLOADS = 200
+
+# Marks a column that must be present and non-empty on every row
+REQUIRED = object()
+
+# Column schemas for each upload type: (column, kind, default).
+# These mirror the Student/StudentAttendance/StudentAssessment/FeePayment models.
+SCHEMAS = {
+    "students": [
+        ("student_id", "str", REQUIRED),
+        ("name", "str", REQUIRED),
+        ("email", "str", REQUIRED),
+        ("phone", "str", ""),
+        ("course", "str", REQUIRED),
+        ("semester", "int", REQUIRED),
+    ],
+    "attendance": [
+        ("student_id", "str", REQUIRED),
+        ("subject", "str", REQUIRED),
+        ("total_classes", "int", REQUIRED),
+        ("attended_classes", "int", REQUIRED),
+        ("attendance_percentage", "float", REQUIRED),
+        ("month", "str", REQUIRED),
+        ("year", "int", REQUIRED),
+    ],
+    "assessments": [
+        ("student_id", "str", REQUIRED),
+        ("subject", "str", REQUIRED),
+        ("assessment_type", "str", REQUIRED),
+        ("score", "float", REQUIRED),
+        ("max_score", "float", REQUIRED),
+        ("percentage", "float", REQUIRED),
+        ("date", "datetime", REQUIRED),
+        ("attempt_number", "int", 1),
+    ],
+    "fees": [
+        ("student_id", "str", REQUIRED),
+        ("amount_due", "float", REQUIRED),
+        ("amount_paid", "float", 0.0),
+        ("due_date", "datetime", REQUIRED),
+        ("paid_date", "datetime", None),
+        ("status", "str", REQUIRED),
+        ("semester", "int", REQUIRED),
+    ],
+}
+
+# Upload types whose model carries a created_at timestamp
+TIMESTAMPED = {"students": "created_at"}
+
+# Natural keys used by the upsert mode to match a row with an existing record
+NATURAL_KEYS = {
+    "students": ["student_id"],
+    "attendance": ["student_id", "subject", "month", "year"],
+    "assessments": ["student_id", "subject", "assessment_type", "date", "attempt_number"],
+    "fees": ["student_id", "semester", "due_date"],
+}
+
+# insert: append every row; upsert: insert new natural keys, update changed ones
+INGEST_MODES = ("insert", "upsert")
+
+
+def _coerce_column(raw, kind, default):
+    """Coerce a whole column at once, returning (values, invalid_mask)."""
+    missing = raw.isna()
+    required = default is REQUIRED
+
+    if kind == "str":
+        values = raw.astype(str).astype(object)
+        invalid = missing if required else pd.Series(False, index=raw.index)
+        if not required:
+            values[missing] = default
+        return values, invalid
+
+    if kind in ("int", "float"):
+        values = pd.to_numeric(raw, errors="coerce")
+        invalid = values.isna() & ~missing
+        if required:
+            invalid |= missing
+        else:
+            values = values.fillna(default)
+        if kind == "int":
+            invalid |= values.notna() & (values % 1 != 0)
+            values = values.where(~invalid, 0).fillna(0).astype("int64")
+        else:
+            values = values.astype("float64")
+        return values, invalid
+
+    if kind == "datetime":
+        values = pd.to_datetime(raw, errors="coerce", format="mixed")
+        invalid = values.isna() & ~missing
+        if required:
+            invalid |= missing
+        values = values.astype(object).where(values.notna(), default if not required else None)
+        return values, invalid
+
+    raise ValueError(f"Unknown column kind: {kind}")
+
+
+def coerce_frame(df, schema_name):
+    """Validate and coerce an uploaded sheet column-by-column.
+
+    Returns the cleaned DataFrame (only valid rows), the number of rejected
+    rows and up to MAX_REPORTED_ERRORS per-row error entries. Row numbers are
+    spreadsheet rows taken from the frame's positional index, i.e. the header
+    is row 1 and index 0 is row 2.
+    """
+    fields = SCHEMAS[schema_name]
+    missing_columns = [name for name, _, default in fields if default is REQUIRED and name not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+
+    columns = {}
+    invalid_rows = pd.Series(False, index=df.index)
+    errors = []
+
+    for name, kind, default in fields:
+        raw = df[name] if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+        values, invalid = _coerce_column(raw, kind, default)
+        if invalid.any():
+            for idx in invalid[invalid].index[:max(MAX_REPORTED_ERRORS - len(errors), 0)]:
+                errors.append({
+                    "row": int(idx) + 2,
+                    "column": name,
+                    "value": None if pd.isna(raw[idx]) else str(raw[idx]),
+                    "error": f"missing {kind} value" if pd.isna(raw[idx]) else f"invalid {kind} value",
+                })
+            invalid_rows |= invalid
+        columns[name] = values
+
+    clean = pd.DataFrame(columns)[~invalid_rows]
+    clean.insert(0, "id", [str(uuid.uuid4()) for _ in range(len(clean))])
+    if schema_name in TIMESTAMPED:
+        clean[TIMESTAMPED[schema_name]] = datetime.now(timezone.utc)
+
+    return clean, int(invalid_rows.sum()), errors
+
+
+def iter_record_chunks(frame, chunk_size=INGEST_CHUNK_SIZE):
+    """Yield lists of plain dicts, materializing one chunk at a time."""
+    for start in range(0, len(frame), chunk_size):
+        yield frame.iloc[start:start + chunk_size].to_dict("records")
+
+
+def collect_write_errors(error, chunk, errors):
+    for write_error in error.details.get("writeErrors", []):
+        if len(errors) >= MAX_REPORTED_ERRORS:
+            break
+        errors.append({
+            "student_id": chunk[write_error["index"]].get("student_id"),
+            "error": write_error.get("errmsg", "write error"),
+        })
+
+
+def drop_duplicate_keys(clean, schema_name):
+    """Keep the last row per natural key so one batch never upserts a key twice."""
+    deduped = clean.drop_duplicates(subset=NATURAL_KEYS[schema_name], keep="last")
+    return deduped, len(clean) - len(deduped)
+
+
+def upsert_operations(records, schema_name):
+    """Pipeline upserts that leave rows identical to the stored ones untouched.
+
+    updated_at (which incremental exports follow) is only stamped when a
+    field actually changes, so unchanged rows are reported as unchanged.
+    """
+    key_fields = NATURAL_KEYS[schema_name]
+    # The app clock, like the export watermarks compared against it
+    now = datetime.now(timezone.utc)
+    operations = []
+    for record in records:
+        fields = dict(record)
+        # Existing records keep their id (and created_at) on update
+        on_insert = {"id": fields.pop("id")}
+        if schema_name in TIMESTAMPED:
+            on_insert[TIMESTAMPED[schema_name]] = fields.pop(TIMESTAMPED[schema_name])
+        key = {field: fields[field] for field in key_fields}
+        # $literal keeps values such as "$c" from being read as field paths
+        changed = {"$or": [{"$ne": [f"${field}", {"$literal": value}]} for field, value in fields.items()]}
+        # All expressions of one $set stage see the stored document, before any change
+        operations.append(UpdateOne(key, [{"$set": {
+            **{field: {"$literal": value} for field, value in fields.items()},
+            **{field: {"$ifNull": [f"${field}", {"$literal": value}]} for field, value in on_insert.items()},
+            "updated_at": {"$cond": [changed, {"$literal": now}, "$updated_at"]},
+        }}], upsert=True))
+    return operations
+
+
+def write_counts(mode, result=None, details=None):
+    """inserted (and for upserts updated/unchanged) counts of a bulk write, from
+    its result or, when it failed part way, from the BulkWriteError details."""
+    if mode == "upsert":
+        if result is not None:
+            upserted, matched, modified = result.upserted_count, result.matched_count, result.modified_count
+        else:
+            upserted, matched, modified = details.get("nUpserted", 0), details.get("nMatched", 0), details.get("nModified", 0)
+        return {"inserted": upserted, "updated": modified, "unchanged": matched - modified}
+    return {"inserted": len(result.inserted_ids) if result is not None else details.get("nInserted", 0)}
+
+
+def _fully_inserted(mode, records, counts):
+    # True when every record went in as a new row, so derived data can be
+    # updated additively rather than recomputed
+    return mode == "insert" and counts.get("inserted") == len(records)
+
+
+def write_records(collection, records, schema_name, mode="insert", errors=None, on_write=None):
+    """Synchronous (pymongo) write of one batch; returns per-outcome counts.
+
+    `on_write(records, fully_inserted)` is called after the write.
+    """
+    if not records:
+        return {}
+    try:
+        if mode == "upsert":
+            result = collection.bulk_write(upsert_operations(records, schema_name), ordered=False)
+        else:
+            result = collection.insert_many(records, ordered=False)
+        counts = write_counts(mode, result=result)
+    except BulkWriteError as e:
+        if errors is not None:
+            collect_write_errors(e, records, errors)
+        counts = write_counts(mode, details=e.details)
+    if on_write is not None:
+        on_write(records, _fully_inserted(mode, records, counts))
+    return counts
+
+
+async def write_chunks(collection, chunks, schema_name, mode="insert", errors=None, on_write=None):
+    """write_records over several chunks of a Motor collection; returns summed counts.
+
+    Each chunk goes through write_records on the pymongo collection behind
+    `collection`, in a worker thread as Motor would run it; `on_write` is
+    awaited.
+    """
+    sync_collection = collection.database.delegate[collection.name]
+    totals = {}
+    for chunk in chunks:
+        if not chunk:
+            continue
+        counts = await asyncio.to_thread(write_records, sync_collection, chunk, schema_name, mode, errors)
+        if on_write is not None:
+            await on_write(chunk, _fully_inserted(mode, chunk, counts))
+        for outcome, count in counts.items():
+            totals[outcome] = totals.get(outcome, 0) + count
+    return totals
+
+
+def clean_frame(df, schema_name, mode="insert"):
+    """coerce_frame plus, for upserts, dropping repeated natural keys.
+
+    Returns (clean, rejected, errors, duplicates).
+    """
+    clean, rejected, errors = coerce_frame(df, schema_name)
+    duplicates = 0
+    if mode == "upsert":
+        clean, duplicates = drop_duplicate_keys(clean, schema_name)
+    return clean, rejected, errors, duplicates
+
+
+def parse_sheet(contents, schema_name, mode="insert"):
+    """Read and clean a whole uploaded workbook; runs on the parse executor.
+
+    Returns (total_rows, record chunks, rejected, errors, duplicates).
+    """
+    df = pd.read_excel(io.BytesIO(contents))
+    clean, rejected, errors, duplicates = clean_frame(df, schema_name, mode)
+    return len(df), list(iter_record_chunks(clean)), rejected, errors, duplicates
+
+
+async def write_ordered(collection, records, schema_name, mode="insert", session=None):
+    """Ordered write of one batch that stops at the first failing row.
+
+    Returns per-outcome counts; a BulkWriteError is raised as is, so a
+    surrounding transaction aborts.
+    """
+    if mode == "upsert":
+        result = await collection.bulk_write(upsert_operations(records, schema_name), ordered=True, session=session)
+    else:
+        result = await collection.insert_many(records, ordered=True, session=session)
+    return write_counts(mode, result=result)
+
+
+async def ingest_file(collection, schema_name, contents, started=None, mode="insert", on_write=None):
+    """Vectorized ingest of an uploaded workbook into `collection`.
+
+    Parsing happens on the parse executor, so the event loop only does the writes.
+    """
+    started = started if started is not None else time.perf_counter()
+    total_rows, chunks, rejected, errors, duplicates = await parse_executor.run(parse_sheet, contents, schema_name, mode)
+    counts = await write_chunks(collection, chunks, schema_name, mode, errors, on_write)
+
+    elapsed = time.perf_counter() - started
+    result = {
+        "mode": mode,
+        "total_rows": total_rows,
+        "inserted": 0,
+        **counts,
+        "rejected": rejected,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(total_rows / elapsed, 1) if elapsed > 0 else None,
+    }
+    if mode == "upsert":
+        result["duplicates"] = duplicates
+    return result
+
+
+# Streaming ingest
+# Progress of streamed uploads, keyed by upload id (most recent last)
+upload_progress = OrderedDict()
+
+
+def track_upload(upload_id, schema_name, filename, mode="insert"):
+    while len(upload_progress) >= MAX_TRACKED_UPLOADS:
+        upload_progress.popitem(last=False)
+    progress = {
+        "upload_id": upload_id,
+        "upload_type": schema_name,
+        "filename": filename,
+        "mode": mode,
+        "status": "running",
+        "rows_read": 0,
+        "inserted": 0,
+        "rejected": 0,
+        "errors": [],
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None,
+        "rows_per_second": None,
+    }
+    upload_progress[upload_id] = progress
+    return progress
+
+
+def iter_csv_frames(fileobj, schema_name, batch_size=STREAM_BATCH_SIZE):
+    # Read text columns as str so ids like "001" keep their leading zeros
+    dtypes = {name: str for name, kind, _ in SCHEMAS[schema_name] if kind == "str"}
+    yield from pd.read_csv(fileobj, chunksize=batch_size, dtype=dtypes)
+
+
+def iter_xlsx_frames(fileobj, batch_size=STREAM_BATCH_SIZE):
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell) if cell is not None else "" for cell in next(rows, ())]
+        batch = []
+        offset = 0
+        for row in rows:
+            batch.append(row[:len(header)])
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=header, index=range(offset, offset + len(batch)))
+                offset += len(batch)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header, index=range(offset, offset + len(batch)))
+    finally:
+        workbook.close()
+
+
+def iter_upload_frames(fileobj, filename, schema_name, batch_size=STREAM_BATCH_SIZE):
+    """Pick a frame reader by file extension; legacy .xls is read in one piece."""
+    filename = (filename or "").lower()
+    if filename.endswith(".csv"):
+        return iter_csv_frames(fileobj, schema_name, batch_size)
+    if filename.endswith((".xlsx", ".xlsm")):
+        return iter_xlsx_frames(fileobj, batch_size)
+    return iter([pd.read_excel(fileobj)])
+
+
+def iter_clean_batches(frames, schema_name, mode="insert"):
+    """Coerce each raw batch; yields (rows_read, records, rejected, errors)."""
+    for frame in frames:
+        rows_read = len(frame)
+        # Read-only worksheets often report trailing blank rows
+        frame = frame.dropna(how="all")
+        clean, rejected, errors = coerce_frame(frame, schema_name)
+        if mode == "upsert":
+            clean, _ = drop_duplicate_keys(clean, schema_name)
+        yield rows_read, clean.to_dict("records"), rejected, errors
+
+
+async def ingest_stream(collection, schema_name, frames, progress, mode="insert", on_write=None):
+    """Insert batches from a frame generator, updating `progress` as it goes.
+
+    Parsing runs on the parse executor's threads one batch at a time, so
+    only a single batch is ever held in memory regardless of the file size.
+    """
+    started = time.perf_counter()
+    batches = iter_clean_batches(frames, schema_name, mode)
+    parsing = None
+    try:
+        while True:
+            # Shielded so a cancelled request can still wait for the worker thread below
+            parsing = asyncio.ensure_future(parse_executor.run_local(next, batches, None))
+            batch = await asyncio.shield(parsing)
+            if batch is None:
+                break
+            rows_read, records, rejected, errors = batch
+            progress["errors"].extend(errors[:max(MAX_REPORTED_ERRORS - len(progress["errors"]), 0)])
+            counts = await write_chunks(collection, [records], schema_name, mode, progress["errors"], on_write)
+            for outcome, count in counts.items():
+                progress[outcome] = progress.get(outcome, 0) + count
+            progress["rows_read"] += rows_read
+            progress["rejected"] += rejected
+            elapsed = time.perf_counter() - started
+            progress["rows_per_second"] = round(progress["rows_read"] / elapsed, 1) if elapsed > 0 else None
+        progress["status"] = "completed"
+    except asyncio.CancelledError:
+        progress["status"] = "cancelled"
+        raise
+    except Exception as e:
+        progress["status"] = "failed"
+        progress["detail"] = str(e)
+        raise
+    finally:
+        if parsing is not None and not parsing.done():
+            # Closing the generators while next() still runs in a worker thread
+            # would raise "generator already executing" over the real error
+            await asyncio.wait([parsing])
+        batches.close()
+        if hasattr(frames, "close"):
+            frames.close()
+        progress["finished_at"] = datetime.now(timezone.utc).isoformat()
+        progress["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return progress
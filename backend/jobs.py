@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+import time
+from functools import partial
+from datetime import datetime, timezone
+
+from pymongo import MongoClient
+
+from dashboard_stats import STATS_ID, stats_increment
+from feature_store import update_features_sync
+from ingest import MAX_REPORTED_ERRORS, iter_clean_batches, iter_upload_frames, write_records
+from parsing import spawn_process_pool
+
+
+MAX_CONCURRENT_JOBS = int(os.environ.get('INGEST_MAX_CONCURRENT_JOBS', 2))
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_job_slots = None
+_running_tasks = set()
+
+# One synchronous client per worker process, created lazily
+_worker_db = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = spawn_process_pool(MAX_CONCURRENT_JOBS)
+    return _executor
+
+
+def _get_worker_db(mongo_url, db_name):
+    global _worker_db
+    if _worker_db is None:
+        _worker_db = MongoClient(mongo_url)[db_name]
+    return _worker_db
+
+
+def run_ingest_job(job_id, schema_name, path, filename, mongo_url, db_name, mode="insert"):
+    """Parse and insert an uploaded file inside a worker process."""
+    db = _get_worker_db(mongo_url, db_name)
+    jobs = db.ingest_jobs
+    started = time.perf_counter()
+    counters = {"rows_read": 0, "inserted": 0, "rejected": 0}
+    if mode == "upsert":
+        counters.update(updated=0, unchanged=0)
+    errors = []
+    on_write = partial(update_features_sync, db, schema_name)
+
+    jobs.update_one({"id": job_id}, {"$set": {
+        "status": "running",
+        "started_at": datetime.now(timezone.utc),
+    }})
+    try:
+        with open(path, "rb") as fileobj:
+            frames = iter_upload_frames(fileobj, filename, schema_name)
+            for rows_read, records, rejected, batch_errors in iter_clean_batches(frames, schema_name, mode):
+                errors.extend(batch_errors[:max(MAX_REPORTED_ERRORS - len(errors), 0)])
+                counts = write_records(db[schema_name], records, schema_name, mode, errors, on_write)
+                for outcome, count in counts.items():
+                    counters[outcome] += count
+                if schema_name == "students" and counts.get("inserted"):
+                    db.dashboard_stats.update_one({"_id": STATS_ID}, stats_increment(total_students=counts["inserted"]))
+                counters["rows_read"] += rows_read
+                counters["rejected"] += rejected
+                elapsed = time.perf_counter() - started
+                jobs.update_one({"id": job_id}, {"$set": {
+                    **counters,
+                    "errors": errors,
+                    "rows_per_second": round(counters["rows_read"] / elapsed, 1) if elapsed > 0 else None,
+                }})
+        status, detail = "completed", None
+    except Exception as e:
+        status, detail = "failed", str(e)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    jobs.update_one({"id": job_id}, {"$set": {
+        "status": status,
+        "detail": detail,
+        "finished_at": datetime.now(timezone.utc),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }})
+    return status
+
+
+async def _run_job(db, job_id, *args, on_done=None):
+    global _job_slots
+    if _job_slots is None:
+        _job_slots = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+    async with _job_slots:
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(_get_executor(), run_ingest_job, job_id, *args)
+        except Exception as e:
+            # The worker itself died (e.g. killed for memory); record it here
+            logger.exception("Ingest job %s crashed", job_id)
+            await db.ingest_jobs.update_one({"id": job_id}, {"$set": {
+                "status": "failed",
+                "detail": f"Worker crashed: {str(e)}",
+                "finished_at": datetime.now(timezone.utc),
+            }})
+        if on_done is not None:
+            await on_done()
+
+
+def submit_ingest_job(db, job_id, schema_name, path, filename, mongo_url, db_name, mode="insert", on_done=None):
+    """Queue a job; at most MAX_CONCURRENT_JOBS run at once, the rest wait.
+
+    `on_done()` is awaited in the server process once the job has finished.
+    """
+    task = asyncio.create_task(_run_job(db, job_id, schema_name, path, filename, mongo_url, db_name, mode, on_done=on_done))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+    return task
+
+
+def shutdown_jobs():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
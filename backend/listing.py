@@ -0,0 +1,76 @@
+import json
+import os
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi.responses import StreamingResponse
+
+from pagination import decode_cursor, encode_cursor
+
+
+# Page size when a cursor is passed without a limit
+LIST_DEFAULT_LIMIT = int(os.environ.get('LIST_DEFAULT_LIMIT', 1000))
+LIST_MAX_LIMIT = int(os.environ.get('LIST_MAX_LIMIT', 10000))
+STREAM_BATCH_SIZE = 1000
+
+
+def build_query(date_field=None, date_from=None, date_to=None, **filters):
+    """Equality filters for the given non-empty values plus an optional date range."""
+    query = {field: value for field, value in filters.items() if value is not None}
+    if date_field and (date_from or date_to):
+        query[date_field] = {}
+        if date_from:
+            query[date_field]["$gte"] = date_from
+        if date_to:
+            query[date_field]["$lte"] = date_to
+    return query
+
+
+def parse_fields(fields):
+    """Comma separated field list -> projection; None returns whole documents."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    if any(name.startswith("$") for name in names):
+        raise ValueError("Invalid field name")
+    return {name: 1 for name in names}
+
+
+def serialize(document):
+    return {
+        key: str(value) if isinstance(value, ObjectId) else value.isoformat() if isinstance(value, datetime) else value
+        for key, value in document.items()
+    }
+
+
+async def list_page(collection, query, projection=None, limit=None, cursor=None):
+    """One keyset page ordered by _id; returns (documents, next_cursor).
+
+    With neither `limit` nor `cursor` every matching document is returned.
+    """
+    if limit is None and not cursor:
+        documents = await collection.find(query, projection).sort("_id", 1).to_list(None)
+        return [serialize(document) for document in documents], None
+    limit = max(1, min(limit or LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT))
+    if cursor:
+        try:
+            after = ObjectId(decode_cursor(cursor)["_id"])
+        except Exception:
+            raise ValueError("Invalid cursor")
+        query = {"$and": [query, {"_id": {"$gt": after}}]}
+
+    documents = await collection.find(query, projection).sort("_id", 1).limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor({"_id": str(documents[limit - 1]["_id"])}) if len(documents) > limit else None
+    return [serialize(document) for document in documents[:limit]], next_cursor
+
+
+def stream_ndjson(collection, query, projection=None, limit=None):
+    """Serialize documents as they come off the cursor, one JSON object per line."""
+    async def lines():
+        cursor = collection.find(query, projection).sort("_id", 1).batch_size(STREAM_BATCH_SIZE)
+        if limit:
+            cursor = cursor.limit(limit)
+        async for document in cursor:
+            yield json.dumps(serialize(document), default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,113 @@
+import json
+import re
+
+from metrics import llm_output_parses
+
+
+RISK_LEVELS = ("LOW", "MEDIUM", "HIGH")
+INTERVENTION_PRIORITIES = ("IMMEDIATE", "MODERATE", "LOW")
+MAX_LIST_ITEMS = 10
+
+# JSON schema of the reply the analysis prompt asks for; the fields map
+# one-to-one onto RiskAssessment (summary becomes ai_analysis)
+RISK_OUTPUT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "risk_level": {"type": "string", "enum": list(RISK_LEVELS)},
+        "risk_score": {"type": "number", "minimum": 0, "maximum": 100},
+        "risk_factors": {"type": "array", "items": {"type": "string"}, "maxItems": MAX_LIST_ITEMS},
+        "recommendations": {"type": "array", "items": {"type": "string"}, "maxItems": MAX_LIST_ITEMS},
+        "intervention_priority": {"type": "string", "enum": list(INTERVENTION_PRIORITIES)},
+        "summary": {"type": "string"},
+    },
+    "required": ["risk_level", "risk_score", "risk_factors", "recommendations", "intervention_priority", "summary"],
+    "additionalProperties": False,
+}
+
+OUTPUT_INSTRUCTIONS = (
+    "Reply with a single JSON object and nothing else (no markdown, no prose) "
+    f"matching this JSON schema: {json.dumps(RISK_OUTPUT_SCHEMA, separators=(',', ':'))}"
+)
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def _string_list(payload, field):
+    value = payload[field]
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"{field} must be a list of strings")
+    return [item.strip() for item in value if item.strip()][:MAX_LIST_ITEMS]
+
+
+def _choice(payload, field, choices):
+    value = payload[field]
+    if not isinstance(value, str) or value.strip().upper() not in choices:
+        raise ValueError(f"{field} must be one of: {', '.join(choices)}")
+    return value.strip().upper()
+
+
+def parse_risk_output(text):
+    """Validate a reply against RISK_OUTPUT_SCHEMA; raises ValueError.
+
+    Tolerates a markdown code fence around the object, nothing else.
+    """
+    text = _FENCE.sub("", (text or "").strip())
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Reply is not valid JSON: {e.msg} at position {e.pos}")
+    if not isinstance(payload, dict):
+        raise ValueError("Reply must be a JSON object")
+
+    missing = [field for field in RISK_OUTPUT_SCHEMA["required"] if field not in payload]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    unexpected = sorted(set(payload) - set(RISK_OUTPUT_SCHEMA["properties"]))
+    if unexpected:
+        raise ValueError(f"Unexpected fields: {', '.join(unexpected)}")
+
+    score = payload["risk_score"]
+    if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 100:
+        raise ValueError("risk_score must be a number from 0 to 100")
+    if not isinstance(payload["summary"], str) or not payload["summary"].strip():
+        raise ValueError("summary must be a non-empty string")
+
+    return {
+        "risk_level": _choice(payload, "risk_level", RISK_LEVELS),
+        "risk_score": float(score),
+        "risk_factors": _string_list(payload, "risk_factors"),
+        "recommendations": _string_list(payload, "recommendations"),
+        "intervention_priority": _choice(payload, "intervention_priority", INTERVENTION_PRIORITIES),
+        "summary": payload["summary"].strip(),
+    }
+
+
+def repair_prompt(reply, error):
+    return (
+        f"Your previous reply could not be used: {error}.\n"
+        f"Previous reply: {reply[:2000]}\n"
+        f"{OUTPUT_INSTRUCTIONS}"
+    )
+
+
+async def parse_with_repair(reply, ask):
+    """Parse `reply`, asking once for a corrected reply if it is malformed.
+
+    `ask(prompt)` sends a follow-up message and returns the new reply.
+    Returns (parsed, raw_reply); parsed is None when the repair fails too.
+    """
+    try:
+        parsed = parse_risk_output(reply)
+        llm_output_parses.inc(outcome="parsed")
+        return parsed, reply
+    except ValueError as e:
+        error = e
+
+    repaired = await ask(repair_prompt(reply, error))
+    try:
+        parsed = parse_risk_output(repaired)
+        llm_output_parses.inc(outcome="repaired")
+        return parsed, repaired
+    except ValueError:
+        llm_output_parses.inc(outcome="failed")
+        return None, repaired
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import time
+import uuid
+
+from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+from llm_retry import CircuitBreaker, is_rate_limit_error
+from metrics import llm_call_duration, llm_tokens
+from prompt_builder import estimate_tokens
+
+
+LLM_MAX_IN_FLIGHT = int(os.environ.get('LLM_MAX_IN_FLIGHT', 8))
+LLM_CALL_TIMEOUT = float(os.environ.get('LLM_CALL_TIMEOUT', 60.0))
+
+
+class LlmPool:
+    """Per-analysis LlmChat sessions sharing one in-flight limit and breaker.
+
+    Each analysis gets its own session id, so no conversation history is
+    carried from one student to the next. At most `max_in_flight` calls run
+    at once across all requests, each bounded by `timeout` seconds.
+    """
+
+    def __init__(self, api_key, system_message, provider, model,
+                 max_in_flight=LLM_MAX_IN_FLIGHT, timeout=LLM_CALL_TIMEOUT, breaker=None):
+        self.api_key = api_key
+        self.system_message = system_message
+        self.provider = provider
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.in_flight = 0
+        self.counters = {"sessions": 0, "calls": 0, "timeouts": 0, "errors": 0, "rejected": 0}
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    def session(self):
+        self.counters["sessions"] += 1
+        return LlmChat(
+            api_key=self.api_key,
+            session_id=f"risk-analysis-{uuid.uuid4()}",
+            system_message=self.system_message,
+        ).with_model(self.provider, self.model)
+
+    def _check_breaker(self):
+        try:
+            return self.breaker.check()
+        except Exception:
+            self.counters["rejected"] += 1
+            raise
+
+    async def send(self, chat, text):
+        async with self._slots:
+            # Checked once, with a slot held, so a half-open trial is claimed only by the call that makes it
+            trial = self._check_breaker()
+            self.in_flight += 1
+            self.counters["calls"] += 1
+            llm_tokens.inc(estimate_tokens(text), kind="prompt")
+            started = time.perf_counter()
+            try:
+                reply = await asyncio.wait_for(chat.send_message(UserMessage(text=text)), self.timeout)
+            except asyncio.TimeoutError:
+                self.counters["timeouts"] += 1
+                llm_call_duration.observe(time.perf_counter() - started, outcome="timeout")
+                self.breaker.record_failure()
+                raise TimeoutError(f"LLM call timed out after {self.timeout:g}s")
+            except Exception as e:
+                self.counters["errors"] += 1
+                llm_call_duration.observe(time.perf_counter() - started, outcome="error")
+                # A rate limit is the provider pacing us, not failing; a trial is released below
+                if not is_rate_limit_error(e):
+                    self.breaker.record_failure()
+                raise
+            else:
+                llm_call_duration.observe(time.perf_counter() - started, outcome="ok")
+                llm_tokens.inc(estimate_tokens(reply or ""), kind="completion")
+                self.breaker.record_success()
+                return reply
+            finally:
+                self.in_flight -= 1
+                if trial and self.breaker.trial_running:
+                    # Rate limited, or cancelled (e.g. by /analyze/batch), before any outcome was recorded
+                    self.breaker.release()
+
+    def stats(self):
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "timeout_seconds": self.timeout,
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.times_opened,
+        }
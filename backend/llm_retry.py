@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 3))
+LLM_RETRY_BASE_DELAY = float(os.environ.get('LLM_RETRY_BASE_DELAY', 1.0))
+LLM_RATE_LIMIT_COOLDOWN = float(os.environ.get('LLM_RATE_LIMIT_COOLDOWN', 10.0))
+LLM_BREAKER_THRESHOLD = int(os.environ.get('LLM_BREAKER_THRESHOLD', 5))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get('LLM_BREAKER_RESET_SECONDS', 30.0))
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limit_error(error):
+    text = str(error).lower()
+    return "ratelimit" in type(error).__name__.lower() or "429" in text or "rate limit" in text
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = getattr(error, "retry_after", None) or headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitGate:
+    """Shared pause that every LLM caller waits on after a rate-limit response.
+
+    One 429 pauses the whole fan-out instead of each task hammering the
+    provider with its own retries.
+    """
+
+    def __init__(self):
+        self.resume_at = 0.0
+
+    async def wait(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def trip(self, seconds):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+
+llm_rate_limit = RateLimitGate()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a failing provider for a while.
+
+    After `threshold` consecutive failures the circuit opens and calls fail
+    fast for `reset_after` seconds; then one trial call is let through and
+    its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold=LLM_BREAKER_THRESHOLD, reset_after=LLM_BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def check(self):
+        """Raise CircuitOpenError, or admit the call; True when it is the half-open trial.
+
+        The caller must end a trial with record_success, record_failure or
+        release, also when it is cancelled.
+        """
+        state = self.state
+        if state == "open" or (state == "half-open" and self.trial_running):
+            raise CircuitOpenError("LLM provider circuit is open after repeated failures")
+        if state == "half-open":
+            self.trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def release(self):
+        """End a call that says nothing about provider health (e.g. a 429)."""
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_running or (self.opened_at is None and self.failures >= self.threshold):
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+            logger.warning("LLM circuit opened after %d consecutive failures", self.failures)
+        self.trial_running = False
+
+
+async def call_with_retry(make_call, retries=LLM_MAX_RETRIES, base_delay=LLM_RETRY_BASE_DELAY, gate=llm_rate_limit):
+    """Await `make_call()` with exponential backoff and jitter."""
+    for attempt in range(retries + 1):
+        await gate.wait()
+        try:
+            return await make_call()
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = base_delay * (2 ** attempt) * (0.5 + random.random())
+            if is_rate_limit_error(e):
+                delay = max(delay, _retry_after(e) or LLM_RATE_LIMIT_COOLDOWN)
+                gate.trip(delay)
+            logger.warning("LLM call failed (attempt %d/%d), retrying in %.1fs: %s", attempt + 1, retries + 1, delay, e)
+            await asyncio.sleep(delay)
@@ -0,0 +1,216 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+from pymongo import monitoring
+from starlette.routing import Match
+
+
+# Minimal Prometheus-style registry, rendered by GET /api/metrics in the
+# text exposition format. Mongo listener callbacks run on Motor's executor
+# threads, hence the lock.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+LOOP_LAG_INTERVAL = 0.5
+
+# Route template of the request being handled, e.g. "/api/students/{student_id}/features".
+# Motor copies the context into its executor, so the Mongo listener sees it too.
+current_handler = contextvars.ContextVar("current_handler", default="background")
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help_text):
+        self.name, self.help = name, help_text
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(_label_key(labels), 0)
+
+    def by(self, label, names):
+        """{name: value} for each of `names` as the value of `label`, zero when never seen."""
+        return {name: self.get(**{label: name}) for name in names}
+
+    def samples(self):
+        return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[_label_key(labels)] = value
+
+    def set_max(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = max(self.values.get(key, value), value)
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name, self.help = name, help_text
+        self.buckets = buckets
+        # label key -> [per-bucket counts, sum, count]
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            entry = self.values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        samples = []
+        for key, (counts, total, count) in self.values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                samples.append((f"{self.name}_bucket", key + (("le", f"{bound:g}"),), bucket_count))
+            samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), count))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, count))
+        return samples
+
+
+def render():
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value:g}" if isinstance(value, float) else f"{name}{_format_labels(key)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+http_request_duration = Histogram("http_request_duration_seconds", "Time to response headers per route")
+http_requests_in_flight = Gauge("http_requests_in_flight", "Requests currently being handled")
+mongo_commands = Counter("mongo_commands_total", "Mongo commands per handler, command and outcome")
+mongo_command_duration = Histogram("mongo_command_duration_seconds", "Mongo command duration per handler and command")
+llm_call_duration = Histogram("llm_call_duration_seconds", "LLM call duration by outcome", LLM_BUCKETS)
+llm_tokens = Counter("llm_tokens_total", "Estimated LLM tokens sent (prompt) and received (completion)")
+ingest_rows = Counter("ingest_rows_total", "Uploaded rows per upload type and outcome")
+ingest_rows_per_second = Gauge("ingest_rows_per_second", "Rows parsed per second by the last upload of each type")
+event_loop_lag = Histogram("event_loop_lag_seconds", "Delay of the event loop behind a periodic timer", LOOP_LAG_BUCKETS)
+llm_prompts = Counter("llm_prompts_total", "Analysis prompts sent to the LLM")
+llm_prompts_truncated = Counter("llm_prompts_truncated_total", "Analysis prompts trimmed to fit PROMPT_TOKEN_BUDGET")
+llm_prompt_tokens = Counter("llm_prompt_tokens_total", "Estimated tokens of the analysis prompts sent")
+llm_prompt_max_tokens = Gauge("llm_prompt_max_tokens", "Largest analysis prompt sent, in estimated tokens")
+llm_output_parses = Counter("llm_output_parses_total", "LLM replies by parse outcome (parsed, repaired, failed)")
+analysis_cache_events = Counter("analysis_cache_events_total", "Analysis cache hits, misses, stores and evictions")
+
+
+def route_template(app, scope):
+    """Path template of the matching route, so ids do not explode label cardinality."""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+
+def instrument(app):
+    """Register the timing middleware on `app`."""
+    @app.middleware("http")
+    async def record_request_metrics(request, call_next):
+        handler = route_template(app, request.scope)
+        token = current_handler.set(handler)
+        started = time.perf_counter()
+        http_requests_in_flight.inc(1)
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            http_requests_in_flight.inc(-1)
+            http_request_duration.observe(
+                time.perf_counter() - started, method=request.method, route=handler, status=str(status)
+            )
+            current_handler.reset(token)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Counts and times every Mongo command against the handler that issued it."""
+
+    def __init__(self):
+        self._handlers = {}
+
+    def started(self, event):
+        self._handlers[(event.connection_id, event.request_id)] = current_handler.get()
+
+    def _finish(self, event, outcome):
+        handler = self._handlers.pop((event.connection_id, event.request_id), current_handler.get())
+        mongo_commands.inc(handler=handler, command=event.command_name, outcome=outcome)
+        mongo_command_duration.observe(event.duration_micros / 1e6, handler=handler, command=event.command_name)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+def observe_upload(schema_name, result):
+    """Record the counters of one finished upload (ingest_file/ingest_stream result)."""
+    for outcome in ("inserted", "updated", "unchanged", "rejected"):
+        if result.get(outcome):
+            ingest_rows.inc(result[outcome], upload_type=schema_name, outcome=outcome)
+    if result.get("rows_per_second"):
+        ingest_rows_per_second.set(result["rows_per_second"], upload_type=schema_name)
+
+
+def prompt_stats():
+    """Prompt counters as reported by /api/llm/stats."""
+    return {
+        "prompts": llm_prompts.get(),
+        "total_tokens": llm_prompt_tokens.get(),
+        "max_tokens": llm_prompt_max_tokens.get(),
+        "truncated": llm_prompts_truncated.get(),
+    }
+
+
+def parse_stats():
+    return llm_output_parses.by("outcome", ("parsed", "repaired", "failed"))
+
+
+def cache_stats():
+    return analysis_cache_events.by("event", ("hits", "misses", "stores", "evictions"))
+
+
+async def monitor_event_loop(interval=LOOP_LAG_INTERVAL):
+    """Sleep `interval` repeatedly; any overshoot is time the loop was blocked."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(time.perf_counter() - started - interval, 0.0))
@@ -0,0 +1,79 @@
+import os
+import time
+
+from bulk import chunked, insert_chunks
+from dashboard_stats import increment_stats
+
+
+NOTIFICATION_FLUSH_SIZE = int(os.environ.get('NOTIFICATION_FLUSH_SIZE', 200))
+# Longest a buffered notification waits before it is written during a batch
+NOTIFICATION_FLUSH_SECONDS = float(os.environ.get('NOTIFICATION_FLUSH_SECONDS', 2))
+PRIORITIES = ("high", "medium", "low")
+
+
+class NotificationWriter:
+    """Buffers new notifications and writes them with one insert_many per flush.
+
+    add() only buffers; callers await flush_if_due() between units of work
+    (a flush happens once `flush_size` are waiting or the oldest has waited
+    `flush_seconds`) and flush() at the end. `on_flush(notifications)` runs
+    after each write, e.g. to invalidate caches and publish events.
+    """
+
+    def __init__(self, db, on_flush=None, flush_size=NOTIFICATION_FLUSH_SIZE, flush_seconds=NOTIFICATION_FLUSH_SECONDS):
+        self.db = db
+        self.on_flush = on_flush
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.pending = []
+        self.oldest = None
+        self.written = 0
+
+    def add(self, notification):
+        if not self.pending:
+            self.oldest = time.monotonic()
+        self.pending.append(notification)
+
+    def due(self):
+        return bool(self.pending) and (
+            len(self.pending) >= self.flush_size or time.monotonic() - self.oldest >= self.flush_seconds
+        )
+
+    async def flush_if_due(self):
+        return await self.flush() if self.due() else 0
+
+    async def flush(self):
+        """Write everything buffered; returns the number inserted."""
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, []
+        inserted = await insert_chunks(self.db.notifications, chunked(batch, self.flush_size))
+        await increment_stats(self.db, unread_notifications=inserted)
+        self.written += inserted
+        if self.on_flush:
+            await self.on_flush(batch)
+        return inserted
+
+
+async def mark_read(db, query):
+    """Mark the unread notifications matching `query` as read; returns how many changed."""
+    result = await db.notifications.update_many({**query, "is_read": False}, {"$set": {"is_read": True}})
+    await increment_stats(db, unread_notifications=-result.modified_count)
+    return result.modified_count
+
+
+async def unread_counts(db):
+    """Unread notifications per priority.
+
+    The $match/$group only touch is_read and priority, so the
+    is_read_priority index answers it without reading any documents.
+    """
+    rows = await db.notifications.aggregate([
+        {"$match": {"is_read": False}},
+        {"$group": {"_id": "$priority", "count": {"$sum": 1}}},
+    ]).to_list(None)
+    counts = {row["_id"]: row["count"] for row in rows}
+    by_priority = {priority: counts.pop(priority, 0) for priority in PRIORITIES}
+    # Anything outside the usual priorities is still counted in the total
+    by_priority.update({str(priority): count for priority, count in counts.items()})
+    return {"total": sum(by_priority.values()), "by_priority": by_priority}
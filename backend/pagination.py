@@ -0,0 +1,36 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(values):
+    """Opaque keyset cursor holding the sort values of the last returned row."""
+    payload = {
+        key: {"$date": value.isoformat()} if isinstance(value, datetime) else value
+        for key, value in values.items()
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        return {
+            key: datetime.fromisoformat(value["$date"]) if isinstance(value, dict) and "$date" in value else value
+            for key, value in payload.items()
+        }
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_filter(sort_field, descending, cursor_values, tiebreak):
+    """Match rows after the cursor for a sort of {sort_field: ±1, tiebreak: 1}."""
+    value = cursor_values[sort_field]
+    if sort_field == tiebreak:
+        return {sort_field: {"$lt" if descending else "$gt": value}}
+    return {"$or": [
+        {sort_field: {"$lt" if descending else "$gt": value}},
+        {sort_field: value, tiebreak: {"$gt": cursor_values[tiebreak]}},
+    ]}
@@ -0,0 +1,119 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from metrics import Counter, Gauge, Histogram
+
+
+PARSE_EXECUTOR = os.environ.get('PARSE_EXECUTOR', 'thread')  # thread, process
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+# Uploads parsed at once; further uploads wait for a slot, up to PARSE_QUEUE_TIMEOUT seconds
+PARSE_MAX_UPLOADS = int(os.environ.get('PARSE_MAX_UPLOADS', PARSE_WORKERS * 2))
+PARSE_QUEUE_TIMEOUT = float(os.environ.get('PARSE_QUEUE_TIMEOUT', 30))
+PARSE_EXECUTOR_KINDS = ("thread", "process")
+
+parse_task_duration = Histogram("parse_task_duration_seconds", "Parsing steps run on the parse executor, by step")
+parse_uploads = Gauge("parse_uploads", "Uploads holding (active) or waiting for (waiting) a parsing slot")
+parse_uploads_rejected = Counter("parse_uploads_rejected_total", "Uploads turned away because no parsing slot freed up")
+
+
+class ParserBusyError(Exception):
+    pass
+
+
+def spawn_process_pool(workers):
+    """Process pool for CPU-bound upload work (parsing here, ingest jobs in jobs.py).
+
+    Workers are spawned, not forked, so they never inherit the server's
+    event loop or Motor client.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+class ParsingExecutor:
+    """Runs pandas/openpyxl work for uploads off the event loop.
+
+    Every upload first takes one of `max_uploads` slots, waiting at most
+    `queue_timeout` seconds before ParserBusyError; its parsing steps then
+    run on a pool of `workers` threads or spawned processes. run_local()
+    always uses threads, for work tied to objects that cannot leave the
+    process (open upload files, generators).
+    """
+
+    def __init__(self, kind=PARSE_EXECUTOR, workers=PARSE_WORKERS, max_uploads=PARSE_MAX_UPLOADS,
+                 queue_timeout=PARSE_QUEUE_TIMEOUT):
+        if kind not in PARSE_EXECUTOR_KINDS:
+            raise ValueError(f"PARSE_EXECUTOR must be one of: {', '.join(PARSE_EXECUTOR_KINDS)}")
+        self.kind = kind
+        self.workers = workers
+        self.max_uploads = max_uploads
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._slots = None
+        self._threads = None
+        self._processes = None
+
+    def _thread_pool(self):
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parse")
+        return self._threads
+
+    def _pool(self):
+        if self.kind == "thread":
+            return self._thread_pool()
+        if self._processes is None:
+            self._processes = spawn_process_pool(self.workers)
+        return self._processes
+
+    def _update_gauges(self):
+        parse_uploads.set(self.active, state="active")
+        parse_uploads.set(self.waiting, state="waiting")
+
+    async def acquire(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_uploads)
+        self.waiting += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            parse_uploads_rejected.inc()
+            raise ParserBusyError(f"All {self.max_uploads} upload parsing slots are busy; try again shortly")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self._update_gauges()
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+        self._update_gauges()
+
+    async def _run(self, pool, fn, args):
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        finally:
+            parse_task_duration.observe(time.perf_counter() - started, step=getattr(fn, "__name__", "task"))
+
+    async def run(self, fn, *args):
+        """fn(*args) on the configured pool; with processes, fn and args must pickle."""
+        return await self._run(self._pool(), fn, args)
+
+    async def run_local(self, fn, *args):
+        return await self._run(self._thread_pool(), fn, args)
+
+    def stats(self):
+        return {"kind": self.kind, "workers": self.workers, "max_uploads": self.max_uploads,
+                "active": self.active, "waiting": self.waiting}
+
+    def shutdown(self):
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+parse_executor = ParsingExecutor()
@@ -0,0 +1,63 @@
+import asyncio
+import os
+
+
+# Students per bulk load; each batch costs one query per collection
+PROFILE_BATCH_SIZE = int(os.environ.get('PROFILE_BATCH_SIZE', 50))
+
+# Only the fields build_analysis_prompt reads
+STUDENT_PROJECTION = {"_id": 0, "student_id": 1, "name": 1, "course": 1, "semester": 1}
+PROFILE_PROJECTIONS = {
+    "attendance": {"_id": 0, "subject": 1, "attendance_percentage": 1, "month": 1, "year": 1},
+    "assessments": {"_id": 0, "subject": 1, "assessment_type": 1, "percentage": 1, "attempt_number": 1, "date": 1},
+    "fees": {"_id": 0, "amount_due": 1, "amount_paid": 1, "due_date": 1, "status": 1, "semester": 1},
+}
+
+
+async def load_profile(db, student_id, student=None):
+    """Student plus attendance, assessments and fees, or None if there is no such student.
+
+    The queries run concurrently, so the profile costs one round trip
+    rather than four; pass `student` if it is already loaded.
+    """
+    queries = [db[collection].find({"student_id": student_id}, projection).to_list(None)
+               for collection, projection in PROFILE_PROJECTIONS.items()]
+    if student is None:
+        queries.append(db.students.find_one({"student_id": student_id}, STUDENT_PROJECTION))
+    results = await asyncio.gather(*queries)
+    if student is None:
+        student = results.pop()
+        if student is None:
+            return None
+    return {"student": student, **dict(zip(PROFILE_PROJECTIONS, results))}
+
+
+async def _load_batch(db, students):
+    ids = list(students)
+    rows = await asyncio.gather(*(
+        db[collection].find({"student_id": {"$in": ids}}, {**projection, "student_id": 1}).to_list(None)
+        for collection, projection in PROFILE_PROJECTIONS.items()
+    ))
+    profiles = {student_id: {"student": student, **{collection: [] for collection in PROFILE_PROJECTIONS}}
+                for student_id, student in students.items()}
+    for collection, documents in zip(PROFILE_PROJECTIONS, rows):
+        for document in documents:
+            profiles[document.pop("student_id")][collection].append(document)
+    return profiles
+
+
+async def load_profiles(db, student_ids=None, students=None, batch_size=PROFILE_BATCH_SIZE):
+    """Profiles for many students, keyed by student_id; unknown ids are left out.
+
+    Give either `student_ids` or already loaded `students` documents. Every
+    `batch_size` students cost one $in query per collection, run concurrently.
+    """
+    if students is None:
+        students = await db.students.find({"student_id": {"$in": list(student_ids)}}, STUDENT_PROJECTION).to_list(None)
+    by_id = {student["student_id"]: student for student in students}
+    ids = list(by_id)
+    profiles = {}
+    for start in range(0, len(ids), batch_size):
+        batch = {student_id: by_id[student_id] for student_id in ids[start:start + batch_size]}
+        profiles.update(await _load_batch(db, batch))
+    return profiles
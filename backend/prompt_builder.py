@@ -0,0 +1,178 @@
+import calendar
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from metrics import llm_prompt_max_tokens, llm_prompt_tokens, llm_prompts, llm_prompts_truncated
+
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', 1200))
+PROMPT_RECENT_ROWS = int(os.environ.get('PROMPT_RECENT_ROWS', 6))
+# Rough chars-per-token for English/JSON text; close enough for budgeting
+CHARS_PER_TOKEN = 4
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def record_prompt(tokens, truncated=False):
+    llm_prompts.inc()
+    llm_prompt_tokens.inc(tokens)
+    llm_prompt_max_tokens.set_max(tokens)
+    if truncated:
+        llm_prompts_truncated.inc()
+
+
+def _pct(value):
+    return round(float(value), 1)
+
+
+def _mean(values):
+    return _pct(sum(values) / len(values))
+
+
+def _period(row):
+    month = str(row.get("month", "")).strip().lower()
+    number = MONTHS.get(month) or MONTHS.get(month[:3]) or (int(month) if month.isdigit() else 0)
+    return row.get("year") or 0, number
+
+
+def _day(value):
+    return value.strftime("%Y-%m-%d") if isinstance(value, datetime) else str(value)[:10]
+
+
+def summarize_attendance(rows, recent):
+    ordered = sorted(rows, key=_period)
+    by_subject = defaultdict(list)
+    for row in ordered:
+        by_subject[row["subject"]].append(row["attendance_percentage"])
+    subjects = sorted(
+        ({"subject": subject, "avg": _mean(values), "min": _pct(min(values)), "last": _pct(values[-1]), "months": len(values)}
+         for subject, values in by_subject.items()),
+        key=lambda entry: entry["avg"],
+    )
+    return {
+        "avg": _mean([row["attendance_percentage"] for row in ordered]),
+        "subjects": subjects,
+        "recent": [
+            {"subject": row["subject"], "pct": _pct(row["attendance_percentage"]), "period": f"{row.get('year')}-{row.get('month')}"}
+            for row in ordered[-recent:]
+        ],
+    }
+
+
+def summarize_assessments(rows, recent):
+    ordered = sorted(rows, key=lambda row: _day(row.get("date")))
+    by_subject = defaultdict(list)
+    for row in ordered:
+        by_subject[row["subject"]].append(row)
+    subjects = sorted(
+        ({
+            "subject": subject,
+            "avg": _mean([row["percentage"] for row in entries]),
+            "last": _pct(entries[-1]["percentage"]),
+            "change": _pct(entries[-1]["percentage"] - entries[0]["percentage"]),
+            "max_attempt": max(row.get("attempt_number") or 1 for row in entries),
+            "count": len(entries),
+        } for subject, entries in by_subject.items()),
+        key=lambda entry: entry["avg"],
+    )
+    return {
+        "avg": _mean([row["percentage"] for row in ordered]),
+        "subjects": subjects,
+        "recent": [
+            {"subject": row["subject"], "type": row.get("assessment_type"), "pct": _pct(row["percentage"]),
+             "attempt": row.get("attempt_number"), "date": _day(row.get("date"))}
+            for row in ordered[-recent:]
+        ],
+    }
+
+
+def summarize_fees(rows, recent, now):
+    unpaid, overdue = [], 0
+    for row in rows:
+        outstanding = max(float(row.get("amount_due") or 0) - float(row.get("amount_paid") or 0), 0.0)
+        due_date = row.get("due_date")
+        if isinstance(due_date, datetime) and due_date.tzinfo is None:
+            due_date = due_date.replace(tzinfo=timezone.utc)
+        late = str(row.get("status", "")).lower() == "overdue" or (
+            outstanding > 0 and isinstance(due_date, datetime) and due_date < now
+        )
+        overdue += late
+        if outstanding > 0:
+            unpaid.append({"semester": row.get("semester"), "outstanding": round(outstanding, 2), "due": _day(due_date), "late": late})
+    return {
+        "due": round(sum(float(row.get("amount_due") or 0) for row in rows), 2),
+        "paid": round(sum(float(row.get("amount_paid") or 0) for row in rows), 2),
+        "overdue_count": overdue,
+        "unpaid": sorted(unpaid, key=lambda entry: entry["due"])[-recent:],
+    }
+
+
+def render_prompt(student_data):
+    return (
+        "Analyze this student's data for dropout risk. Subjects are listed weakest first; "
+        "\"recent\" holds the latest rows.\n"
+        f"Student Data: {json.dumps(student_data, separators=(',', ':'), default=str)}\n"
+        "Please provide a comprehensive risk assessment as the JSON object described."
+    )
+
+
+def _over_budget(student_data, budget):
+    return estimate_tokens(render_prompt(student_data)) > budget
+
+
+def build_analysis_prompt(student, attendance, assessments, fees, scored=None,
+                          budget=PROMPT_TOKEN_BUDGET, recent=PROMPT_RECENT_ROWS, now=None):
+    """Compact, token-bounded prompt for one student; returns (prompt, student_data).
+
+    History is summarized per subject, with only the latest rows kept
+    verbatim. Over `budget`, the recent rows are halved and then the subject
+    lists cut down to the weakest subjects until the prompt fits; the data
+    is then marked "truncated".
+    """
+    now = now or datetime.now(timezone.utc)
+    student_data = {
+        "student": {"name": student.get("name"), "course": student.get("course"), "semester": student.get("semester")},
+    }
+    if scored is not None:
+        student_data["rules"] = {
+            "score": _pct(scored["risk_score"]),
+            "level": scored["risk_level"],
+            "factors": list(scored["risk_factors"]),
+        }
+    sections = []
+    if attendance:
+        student_data["attendance"] = summarize_attendance(attendance, recent)
+        sections.append((student_data["attendance"], "recent", "subjects"))
+    if assessments:
+        student_data["assessments"] = summarize_assessments(assessments, recent)
+        sections.append((student_data["assessments"], "recent", "subjects"))
+    if fees:
+        student_data["fees"] = summarize_fees(fees, recent, now)
+        sections.append((student_data["fees"], "unpaid", None))
+
+    # Truncation rules, in order: fewer recent rows, then fewer subjects
+    for field in ("recent", "subjects"):
+        while _over_budget(student_data, budget):
+            shortened = False
+            for section, recent_field, subjects_field in sections:
+                name = recent_field if field == "recent" else subjects_field
+                if name and len(section[name]) > 1:
+                    keep = len(section[name]) // 2
+                    if field == "recent":
+                        section[name] = section[name][-keep:]
+                    else:
+                        section["subjects_omitted"] = section.get("subjects_omitted", 0) + len(section[name]) - keep
+                        section[name] = section[name][:keep]
+                    shortened = True
+            if not shortened:
+                break
+            student_data["truncated"] = True
+
+    return render_prompt(student_data), student_data
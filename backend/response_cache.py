@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from metrics import Counter
+
+
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')  # memory, mongo, off
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', 30))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+
+cache_requests = Counter("response_cache_requests_total", "Cached GET routes by result (hit, miss, not_modified)")
+
+
+class MemoryCacheBackend:
+    """Process-local TTL + LRU store; also the stand-in for the shared backend."""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.tag_generations = {}
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        self.entries[key] = (value, time.monotonic() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def generations(self, tags):
+        return {tag: self.tag_generations.get(tag, 0) for tag in tags}
+
+    async def bump(self, tags):
+        for tag in tags:
+            self.tag_generations[tag] = self.tag_generations.get(tag, 0) + 1
+
+
+class MongoCacheBackend:
+    """Shared by every worker through db.response_cache; Mongo's TTL index drops expired entries."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, key):
+        entry = await self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}, {"value": 1}
+        )
+        return entry["value"] if entry else None
+
+    async def set(self, key, value, ttl):
+        await self.collection.replace_one(
+            {"_id": key},
+            {"value": value, "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)},
+            upsert=True,
+        )
+
+    async def generations(self, tags):
+        found = {
+            entry["_id"][len("generation:"):]: entry["value"]
+            async for entry in self.collection.find({"_id": {"$in": [f"generation:{tag}" for tag in tags]}})
+        }
+        return {tag: found.get(tag, 0) for tag in tags}
+
+    async def bump(self, tags):
+        for tag in tags:
+            await self.collection.update_one({"_id": f"generation:{tag}"}, {"$inc": {"value": 1}}, upsert=True)
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+class ResponseCache:
+    """Read-through cache for JSON GET routes.
+
+    Entries are keyed by path, query string and the current generation of
+    each tag the route depends on (e.g. "notifications"); write paths call
+    invalidate() with the tags they touched, so stale entries are never
+    looked up again and age out of the store. Every response carries an
+    ETag, and a matching If-None-Match gets a 304 with no body.
+    """
+
+    def __init__(self, backend, ttl=RESPONSE_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+
+    async def respond(self, request, tags, build):
+        """Serve `build(headers)` through the cache; `build` may add response headers."""
+        route = request.scope.get("route")
+        route = getattr(route, "path", request.url.path)
+        if self.backend is None:
+            headers = {}
+            payload = await build(headers)
+            return self._response(request, self._entry(payload, headers), route, "miss")
+
+        generations = await self.backend.generations(tags)
+        key = "|".join([
+            request.url.path,
+            "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items())),
+            ",".join(f"{tag}:{generation}" for tag, generation in sorted(generations.items())),
+        ])
+        entry = await self.backend.get(key)
+        result = "hit"
+        if entry is None:
+            result = "miss"
+            headers = {}
+            entry = self._entry(await build(headers), headers)
+            await self.backend.set(key, entry, self.ttl)
+        return self._response(request, entry, route, result)
+
+    def _entry(self, payload, headers):
+        body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode("utf-8")
+        return {"body": body, "etag": f'"{hashlib.sha1(body).hexdigest()}"', "headers": headers}
+
+    def _response(self, request, entry, route, result):
+        headers = {**entry["headers"], "ETag": entry["etag"], "Cache-Control": "no-cache", "X-Cache": result.upper()}
+        if _etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+            cache_requests.inc(route=route, result="not_modified")
+            return Response(status_code=304, headers=headers)
+        cache_requests.inc(route=route, result=result)
+        return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+    async def invalidate(self, *tags):
+        if self.backend is not None and tags:
+            await self.backend.bump(tags)
+
+
+def create_response_cache(db, backend=RESPONSE_CACHE_BACKEND):
+    if backend == "off":
+        return ResponseCache(None)
+    if backend == "mongo":
+        return ResponseCache(MongoCacheBackend(db.response_cache))
+    return ResponseCache(MemoryCacheBackend())
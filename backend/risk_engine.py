@@ -0,0 +1,227 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+
+# Thresholds taken from the rules in the LLM system prompt
+ATTENDANCE_THRESHOLD = 75.0
+DECLINE_THRESHOLD = -2.0  # percentage points per 30 days
+LOW_SCORE_THRESHOLD = 40.0
+REPEAT_ATTEMPT_THRESHOLD = 2
+
+HIGH_RISK_SCORE = 60.0
+MEDIUM_RISK_SCORE = 30.0
+# Scores this close to a level boundary are sent to the LLM in "auto" mode
+BORDERLINE_MARGIN = 7.5
+
+DAYS_PER_MONTH = 30.0
+
+RECOMMENDATIONS = {
+    "attendance": "Attendance counseling and mentor follow-up",
+    "declining": "Academic support for declining subjects",
+    "low_scores": "Remedial classes and tutoring",
+    "attempts": "Subject-specific tutoring before the next attempt",
+    "fees": "Financial assistance or fee payment plan",
+}
+
+
+# Reference point for assessment dates so summed x values from different
+# uploads can be combined
+EPOCH = pd.Timestamp("2000-01-01", tz="UTC")
+
+# Per-student statistics kept by the feature store. All but the min/max
+# columns are plain sums, so statistics for new rows can be added on.
+STAT_GROUPS = {
+    "attendance": ["attendance_count", "attendance_sum", "attendance_min"],
+    "assessments": ["assessment_n", "assessment_sx", "assessment_sy", "assessment_sxy", "assessment_sxx", "max_attempt"],
+    "fees": ["fees_late_count", "fees_late_amount"],
+}
+STAT_COLUMNS = [column for columns in STAT_GROUPS.values() for column in columns]
+
+
+def _column(frame, name, default):
+    if name in frame.columns:
+        return frame[name]
+    return pd.Series(default, index=frame.index)
+
+
+def _empty(frame, *columns):
+    return frame is None or frame.empty or any(column not in frame.columns for column in columns)
+
+
+def summarize_rows(attendance=None, assessments=None, fees=None):
+    """Per-student sufficient statistics for the given raw rows.
+
+    Returns a dict of frames indexed by student_id ("attendance",
+    "assessments", "fees"), the max attempt per (student_id, subject) as
+    "subject_attempts" and the unpaid-but-not-yet-late fee rows as
+    "fees_unpaid" (whether those are overdue depends on when you look).
+    """
+    summary = {}
+
+    if not _empty(attendance, "student_id", "attendance_percentage"):
+        percentage = pd.to_numeric(attendance["attendance_percentage"], errors="coerce")
+        grouped = percentage.groupby(attendance["student_id"].astype(str).rename("student_id")).agg(["count", "sum", "min"])
+        summary["attendance"] = grouped.rename(columns={
+            "count": "attendance_count", "sum": "attendance_sum", "min": "attendance_min",
+        })
+
+    if not _empty(assessments, "student_id", "percentage", "date"):
+        frame = pd.DataFrame({
+            "student_id": assessments["student_id"].astype(str),
+            "subject": _column(assessments, "subject", "").astype(str),
+            "y": pd.to_numeric(assessments["percentage"], errors="coerce"),
+            "date": pd.to_datetime(assessments["date"], errors="coerce", utc=True),
+            "attempt": pd.to_numeric(_column(assessments, "attempt_number", 1), errors="coerce").fillna(1),
+        }).dropna(subset=["y", "date"])
+        x = (frame["date"] - EPOCH).dt.total_seconds() / 86400.0 / DAYS_PER_MONTH
+        frame = frame.assign(x=x, xy=x * frame["y"], xx=x * x)
+        summary["assessments"] = frame.groupby("student_id").agg(
+            assessment_n=("x", "size"), assessment_sx=("x", "sum"), assessment_sy=("y", "sum"),
+            assessment_sxy=("xy", "sum"), assessment_sxx=("xx", "sum"), max_attempt=("attempt", "max"),
+        )
+        summary["subject_attempts"] = frame.groupby(["student_id", "subject"])["attempt"].max()
+
+    if not _empty(fees, "student_id", "amount_due"):
+        due = pd.to_numeric(fees["amount_due"], errors="coerce").fillna(0.0)
+        paid = pd.to_numeric(_column(fees, "amount_paid", 0.0), errors="coerce").fillna(0.0)
+        due_date = pd.to_datetime(_column(fees, "due_date", None), errors="coerce", utc=True)
+        paid_date = pd.to_datetime(_column(fees, "paid_date", None), errors="coerce", utc=True)
+        status = _column(fees, "status", "").astype(str).str.lower()
+        outstanding = (due - paid).clip(lower=0.0)
+        student_ids = fees["student_id"].astype(str).rename("student_id")
+
+        late = (status == "overdue") | (paid_date > due_date)
+        unpaid = ~late & (outstanding > 0)
+        summary["fees"] = pd.DataFrame({
+            "fees_late_count": late.groupby(student_ids).sum(),
+            "fees_late_amount": outstanding.where(late, 0.0).groupby(student_ids).sum(),
+        })
+        summary["fees_unpaid"] = pd.DataFrame({
+            "student_id": student_ids[unpaid],
+            "due_date": due_date[unpaid],
+            "amount": outstanding[unpaid],
+        })
+
+    return summary
+
+
+def stats_from_summary(summary, index, now=None):
+    """One row of STAT_COLUMNS per student in `index`, plus the time-dependent
+    repeated_subjects, overdue_fees and overdue_amount columns."""
+    now = now or datetime.now(timezone.utc)
+    stats = pd.DataFrame(index=index)
+    for key in STAT_GROUPS:
+        if key in summary:
+            stats = stats.join(summary[key])
+    stats = stats.reindex(columns=STAT_COLUMNS)
+
+    repeated = pd.Series(0, index=index, dtype="float64")
+    if "subject_attempts" in summary and len(summary["subject_attempts"]):
+        repeated = (summary["subject_attempts"] >= REPEAT_ATTEMPT_THRESHOLD).groupby(level="student_id").sum()
+    stats["repeated_subjects"] = repeated.reindex(index).fillna(0)
+
+    unpaid_count = pd.Series(0.0, index=index)
+    unpaid_amount = pd.Series(0.0, index=index)
+    unpaid = summary.get("fees_unpaid")
+    if unpaid is not None and len(unpaid):
+        past_due = unpaid[pd.to_datetime(unpaid["due_date"], utc=True) < pd.Timestamp(now)]
+        grouped = past_due.groupby("student_id")["amount"].agg(["count", "sum"])
+        unpaid_count = grouped["count"].reindex(index).fillna(0)
+        unpaid_amount = grouped["sum"].reindex(index).fillna(0.0)
+    stats["overdue_fees"] = stats["fees_late_count"].fillna(0) + unpaid_count
+    stats["overdue_amount"] = stats["fees_late_amount"].fillna(0.0) + unpaid_amount
+    return stats
+
+
+def features_from_stats(stats):
+    """Derive scoring features from per-student statistics."""
+    features = pd.DataFrame(index=stats.index)
+    count = stats["attendance_count"]
+    features["attendance_avg"] = stats["attendance_sum"] / count.where(count > 0)
+    features["attendance_min"] = stats["attendance_min"]
+
+    # Least-squares slope from the summed terms, in points per month
+    n, sx, sy = stats["assessment_n"], stats["assessment_sx"], stats["assessment_sy"]
+    sxy, sxx = stats["assessment_sxy"], stats["assessment_sxx"]
+    features["score_avg"] = sy / n.where(n > 0)
+    denominator = n * sxx - sx ** 2
+    # Relative cut-off: with a single assessment date the denominator is only rounding noise
+    denominator = denominator.where(denominator > 1e-12 * n * sxx)
+    features["score_slope"] = ((n * sxy - sx * sy) / denominator).fillna(0.0)
+    features["max_attempt"] = stats["max_attempt"]
+    features["repeated_subjects"] = stats["repeated_subjects"].fillna(0)
+    features["overdue_fees"] = stats["overdue_fees"].fillna(0)
+    features["overdue_amount"] = stats["overdue_amount"].fillna(0.0)
+    return features
+
+
+def score_features(features):
+    """Score every student at once from the output of features_from_stats."""
+    attendance = features["attendance_avg"]
+    slope = features["score_slope"]
+    score_avg = features["score_avg"]
+    repeated = features["repeated_subjects"]
+    overdue = features["overdue_fees"]
+
+    flags = {
+        "attendance": (attendance < ATTENDANCE_THRESHOLD).to_numpy(),
+        "declining": (slope < DECLINE_THRESHOLD).to_numpy(),
+        "low_scores": (score_avg < LOW_SCORE_THRESHOLD).to_numpy(),
+        "attempts": (repeated > 0).to_numpy(),
+        "fees": (overdue > 0).to_numpy(),
+    }
+
+    points = (
+        np.where(flags["attendance"], 30.0 + np.clip((ATTENDANCE_THRESHOLD - attendance.to_numpy()) * 0.5, 0.0, 15.0), 0.0)
+        + np.where(flags["declining"], 20.0, 0.0)
+        + np.where(flags["low_scores"], 15.0, 0.0)
+        + np.where(flags["attempts"], 25.0 + np.clip(repeated.to_numpy() - 1, 0, 2) * 5.0, 0.0)
+        + np.where(flags["fees"], 15.0, 0.0)
+    )
+    # A combination of factors increases overall risk significantly
+    factor_count = np.sum(list(flags.values()), axis=0)
+    points = points + np.clip(factor_count - 1, 0, None) * 10.0
+    risk_score = np.round(np.clip(points, 0.0, 100.0), 1)
+
+    risk_level = np.select(
+        [risk_score >= HIGH_RISK_SCORE, risk_score >= MEDIUM_RISK_SCORE],
+        ["HIGH", "MEDIUM"],
+        default="LOW",
+    )
+    priority = np.select(
+        [risk_level == "HIGH", risk_level == "MEDIUM"],
+        ["IMMEDIATE", "MODERATE"],
+        default="LOW",
+    )
+    needs_review = (risk_level == "HIGH") | (
+        np.minimum(np.abs(risk_score - HIGH_RISK_SCORE), np.abs(risk_score - MEDIUM_RISK_SCORE)) <= BORDERLINE_MARGIN
+    )
+
+    texts = {
+        "attendance": [f"Attendance {value:.1f}% is below {ATTENDANCE_THRESHOLD:.0f}%" for value in attendance.fillna(0.0)],
+        "declining": [f"Scores declining {abs(value):.1f} points per month" for value in slope.fillna(0.0)],
+        "low_scores": [f"Average score {value:.1f}% is below {LOW_SCORE_THRESHOLD:.0f}%" for value in score_avg.fillna(0.0)],
+        "attempts": [f"Multiple attempts in {int(value)} subject(s)" for value in repeated],
+        "fees": [f"{int(value)} delayed or overdue fee payment(s)" for value in overdue],
+    }
+    names = list(flags)
+    rows = list(zip(*(flags[name] for name in names)))
+    risk_factors = [
+        [texts[name][i] for name, flagged in zip(names, row) if flagged]
+        for i, row in enumerate(rows)
+    ]
+    recommendations = [
+        [RECOMMENDATIONS[name] for name, flagged in zip(names, row) if flagged] or ["Continue regular monitoring"]
+        for row in rows
+    ]
+
+    return pd.DataFrame({
+        "risk_score": risk_score,
+        "risk_level": risk_level,
+        "intervention_priority": priority,
+        "risk_factors": risk_factors,
+        "recommendations": recommendations,
+        "needs_review": needs_review,
+    }, index=features.index)
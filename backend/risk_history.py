@@ -0,0 +1,283 @@
+import asyncio
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from bulk import chunked, insert_chunks
+from ingest import INGEST_CHUNK_SIZE
+from pagination import keyset_filter
+
+
+logger = logging.getLogger(__name__)
+
+# Assessments older than this move from db.risk_assessments into monthly
+# per-student buckets in db.risk_history; each student's latest one stays.
+RISK_ARCHIVE_AFTER_DAYS = int(os.environ.get('RISK_ARCHIVE_AFTER_DAYS', 90))
+RISK_ARCHIVE_TEXT = os.environ.get('RISK_ARCHIVE_TEXT', 'compress')  # compress, keep, drop
+RISK_ARCHIVE_BATCH_SIZE = int(os.environ.get('RISK_ARCHIVE_BATCH_SIZE', 1000))
+RISK_ARCHIVE_INTERVAL_HOURS = float(os.environ.get('RISK_ARCHIVE_INTERVAL_HOURS', 24))  # 0 disables
+ARCHIVE_TEXT_MODES = ("compress", "keep", "drop")
+HISTORY_INTERVALS = ("day", "week", "month")
+
+# The bulky LLM output; archived points keep it only per RISK_ARCHIVE_TEXT
+DETAIL_FIELDS = ("ai_analysis", "recommendations")
+DUPLICATE_KEY = 11000
+
+
+def _utc(value):
+    # Mongo hands back naive UTC datetimes
+    return value.replace(tzinfo=timezone.utc) if isinstance(value, datetime) and value.tzinfo is None else value
+
+
+async def update_latest(db, assessments):
+    """Point db.risk_latest at the newest of `assessments` for each student.
+
+    Each upsert only matches a stored assessment that is not newer; if a
+    newer one is already there the upsert collides with the unique
+    student_id index and is ignored, so concurrent writers never move a
+    student back in time.
+    """
+    newest = {}
+    for assessment in assessments:
+        current = newest.get(assessment["student_id"])
+        if current is None or _utc(assessment["assessment_date"]) >= _utc(current["assessment_date"]):
+            newest[assessment["student_id"]] = assessment
+    operations = [
+        UpdateOne(
+            {"student_id": student_id, "assessment_date": {"$lte": assessment["assessment_date"]}},
+            {"$set": {key: value for key, value in assessment.items() if key != "_id"}},
+            upsert=True,
+        )
+        for student_id, assessment in newest.items()
+    ]
+    for start in range(0, len(operations), INGEST_CHUNK_SIZE):
+        try:
+            await db.risk_latest.bulk_write(operations[start:start + INGEST_CHUNK_SIZE], ordered=False)
+        except BulkWriteError as e:
+            if any(error.get("code") != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                raise
+
+
+async def record_assessments(db, assessments):
+    """Insert new assessments and update each student's latest one."""
+    if not assessments:
+        return 0
+    inserted = await insert_chunks(db.risk_assessments, chunked(assessments, INGEST_CHUNK_SIZE))
+    await update_latest(db, assessments)
+    return inserted
+
+
+async def rebuild_latest(db):
+    """Recompute db.risk_latest from db.risk_assessments (which always holds each student's latest)."""
+    latest = db.risk_assessments.aggregate([
+        {"$sort": {"student_id": 1, "assessment_date": -1}},
+        {"$group": {"_id": "$student_id", "latest": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$latest"}},
+        {"$project": {"_id": 0}},
+    ])
+    students, operations = 0, []
+    async for assessment in latest:
+        operations.append(ReplaceOne({"student_id": assessment["student_id"]}, assessment, upsert=True))
+        if len(operations) >= INGEST_CHUNK_SIZE:
+            await db.risk_latest.bulk_write(operations, ordered=False)
+            students += len(operations)
+            operations = []
+    if operations:
+        await db.risk_latest.bulk_write(operations, ordered=False)
+        students += len(operations)
+    return {"students": students}
+
+
+async def ensure_latest(db):
+    """Build db.risk_latest once for assessments that predate it; no-op afterwards."""
+    if await db.risk_latest.estimated_document_count() or not await db.risk_assessments.estimated_document_count():
+        return None
+    return await rebuild_latest(db)
+
+
+def _bucket_start(value):
+    value = _utc(value)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def _archive_point(assessment, text_mode):
+    point = {
+        "id": assessment["id"],
+        "date": assessment["assessment_date"],
+        "level": assessment["risk_level"],
+        "score": assessment["risk_score"],
+        "priority": assessment.get("intervention_priority"),
+        "method": assessment.get("scoring_method"),
+        "factors": assessment.get("risk_factors", []),
+    }
+    detail = {field: assessment.get(field) for field in DETAIL_FIELDS}
+    if text_mode == "keep":
+        point["detail"] = detail
+    elif text_mode == "compress":
+        point["detail_z"] = zlib.compress(json.dumps(detail, default=str).encode("utf-8"))
+    return point
+
+
+async def compact_history(db, older_than_days=RISK_ARCHIVE_AFTER_DAYS, text_mode=RISK_ARCHIVE_TEXT,
+                          batch_size=RISK_ARCHIVE_BATCH_SIZE, now=None):
+    """Move assessments older than `older_than_days` into monthly buckets.
+
+    Points are added with $addToSet before the originals are deleted, so an
+    interrupted run can simply be repeated. Each student's latest
+    assessment is never archived, which keeps rebuild_latest exact.
+    """
+    if text_mode not in ARCHIVE_TEXT_MODES:
+        raise ValueError(f"text_mode must be one of: {', '.join(ARCHIVE_TEXT_MODES)}")
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=older_than_days)
+    archived, buckets, after = 0, set(), None
+    while True:
+        query = {"assessment_date": {"$lt": cutoff}}
+        if after:
+            query = {"$and": [query, keyset_filter("assessment_date", False, after, "_id")]}
+        rows = await db.risk_assessments.find(query).sort([("assessment_date", 1), ("_id", 1)]).to_list(batch_size)
+        if not rows:
+            break
+        after = {"assessment_date": rows[-1]["assessment_date"], "_id": rows[-1]["_id"]}
+
+        latest_ids = {
+            row["id"] async for row in db.risk_latest.find({"id": {"$in": [row["id"] for row in rows]}}, {"_id": 0, "id": 1})
+        }
+        points = {}
+        for row in rows:
+            if row["id"] not in latest_ids:
+                points.setdefault((row["student_id"], _bucket_start(row["assessment_date"])), []).append(row)
+        if points:
+            await db.risk_history.bulk_write([
+                UpdateOne(
+                    {"student_id": student_id, "bucket": bucket},
+                    {
+                        "$addToSet": {"points": {"$each": [_archive_point(row, text_mode) for row in group]}},
+                        "$min": {"first_date": min(row["assessment_date"] for row in group)},
+                        "$max": {"last_date": max(row["assessment_date"] for row in group)},
+                    },
+                    upsert=True,
+                )
+                for (student_id, bucket), group in points.items()
+            ], ordered=False)
+            moved = [row["_id"] for group in points.values() for row in group]
+            await db.risk_assessments.delete_many({"_id": {"$in": moved}})
+            archived += len(moved)
+            buckets.update(points)
+        if len(rows) < batch_size:
+            break
+    return {"archived": archived, "buckets": len(buckets), "cutoff": cutoff}
+
+
+async def compact_periodically(db, interval_hours=RISK_ARCHIVE_INTERVAL_HOURS):
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        try:
+            result = await compact_history(db)
+            logger.info("Archived %s risk assessments into %s buckets", result["archived"], result["buckets"])
+        except Exception:
+            logger.exception("Risk history compaction failed")
+
+
+def _point_from_assessment(assessment, include_detail):
+    point = {
+        "id": assessment["id"],
+        "date": _utc(assessment["assessment_date"]),
+        "level": assessment["risk_level"],
+        "score": assessment["risk_score"],
+        "priority": assessment.get("intervention_priority"),
+        "method": assessment.get("scoring_method"),
+        "factors": assessment.get("risk_factors", []),
+    }
+    if include_detail:
+        point["detail"] = {field: assessment.get(field) for field in DETAIL_FIELDS}
+    return point
+
+
+def _unpack_point(point, include_detail):
+    point = {**point, "date": _utc(point["date"])}
+    compressed = point.pop("detail_z", None)
+    if not include_detail:
+        point.pop("detail", None)
+    elif compressed is not None:
+        point["detail"] = json.loads(zlib.decompress(compressed))
+    return point
+
+
+def _period_start(value, interval):
+    if interval == "month":
+        return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+    day = datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    return day - timedelta(days=day.weekday()) if interval == "week" else day
+
+
+def summarize_series(points, interval):
+    """Per-period trend of `points` (sorted by date): count, score stats and the last level."""
+    periods = {}
+    for point in points:
+        periods.setdefault(_period_start(point["date"], interval), []).append(point)
+    return [
+        {
+            "period": period,
+            "count": len(group),
+            "avg_score": round(sum(point["score"] for point in group) / len(group), 1),
+            "min_score": min(point["score"] for point in group),
+            "max_score": max(point["score"] for point in group),
+            "level": group[-1]["level"],
+        }
+        for period, group in periods.items()
+    ]
+
+
+async def risk_history(db, student_id, since=None, until=None, interval=None, include_detail=False):
+    """A student's assessments, archived and recent, oldest first; None if there are none.
+
+    Recent assessments, archive buckets and the latest assessment are read
+    concurrently. With `interval` the points are summarized per day, week
+    or month instead of returned one by one.
+    """
+    since, until = _utc(since), _utc(until)
+    recent_query, bucket_query = {"student_id": student_id}, {"student_id": student_id}
+    dates = {}
+    if since:
+        dates["$gte"] = since
+        bucket_query["last_date"] = {"$gte": since}
+    if until:
+        dates["$lt"] = until
+        bucket_query["first_date"] = {"$lt": until}
+    if dates:
+        recent_query["assessment_date"] = dates
+    projection = {"_id": 0} if include_detail else {"_id": 0, **{field: 0 for field in DETAIL_FIELDS}}
+
+    recent, buckets, latest = await asyncio.gather(
+        db.risk_assessments.find(recent_query, projection).sort("assessment_date", 1).to_list(None),
+        db.risk_history.find(bucket_query, {"_id": 0, "points": 1}).sort("bucket", 1).to_list(None),
+        db.risk_latest.find_one({"student_id": student_id}, projection),
+    )
+    if latest is None and not recent and not buckets:
+        return None
+
+    points = {}
+    for bucket in buckets:
+        for point in bucket["points"]:
+            point = _unpack_point(point, include_detail)
+            if (not since or point["date"] >= since) and (not until or point["date"] < until):
+                points[point["id"]] = point
+    # A point can be in both places if a compaction run was interrupted
+    for assessment in recent:
+        points[assessment["id"]] = _point_from_assessment(assessment, include_detail)
+    ordered = sorted(points.values(), key=lambda point: point["date"])
+    if latest is not None:
+        latest["assessment_date"] = _utc(latest["assessment_date"])
+
+    history = {"student_id": student_id, "latest": latest, "count": len(ordered)}
+    if interval:
+        history["interval"] = interval
+        history["series"] = summarize_series(ordered, interval)
+    else:
+        history["points"] = ordered
+    return history
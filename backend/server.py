@@ -1,5 +1,5 @@
-from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, Depends, File, UploadFile, HTTPException, Request, Response, Query
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -11,49 +11,86 @@ from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone
 import pandas as pd
-import io
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+import time
+import shutil
+import asyncio
+import tempfile
+from functools import partial
 import json
+from jobs import submit_ingest_job, shutdown_jobs
+from parsing import PARSE_QUEUE_TIMEOUT, ParserBusyError, parse_executor
+from exports import EXPORT_COLLECTIONS, EXPORT_FORMATS, export_available, export_file, submit_export
+from llm_retry import CircuitOpenError, call_with_retry
+from llm_pool import LlmPool
+from risk_engine import score_features
+from feature_store import ensure_features, feature_report, load_features, rebuild_features, update_features
+from pagination import decode_cursor, encode_cursor, keyset_filter
+from listing import build_query, list_page, parse_fields, stream_ndjson
+from prompt_builder import PROMPT_TOKEN_BUDGET, build_analysis_prompt, estimate_tokens, record_prompt
+from llm_output import OUTPUT_INSTRUCTIONS, parse_risk_output, parse_with_repair
+from analysis_cache import cache_key, get_cached_analysis, store_analysis
+from indexes import ensure_indexes, index_report
+from metrics import (MongoCommandMetrics, cache_stats, instrument, monitor_event_loop, observe_upload, parse_stats, prompt_stats,
+                     render as render_metrics)
+from response_cache import create_response_cache
+from events import event_broker
+from risk_history import HISTORY_INTERVALS, RISK_ARCHIVE_INTERVAL_HOURS, compact_history, compact_periodically, ensure_latest, rebuild_latest, record_assessments, risk_history
+from profiles import PROFILE_BATCH_SIZE, STUDENT_PROJECTION, load_profile, load_profiles
+from dashboard_stats import apply_risk_levels, get_stats, increment_stats, rebuild_stats
+from notifications import NotificationWriter, mark_read, unread_counts
+from bundles import ingest_bundle
+from ingest import INGEST_CHUNK_SIZE, INGEST_MODES, SCHEMAS, ingest_file, ingest_stream, iter_csv_frames, iter_xlsx_frames, upload_progress, track_upload
 
 
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
+# Cached GET routes are tagged with what they read; writers invalidate those tags
+response_cache = create_response_cache(db)
 
 # Create the main app without a prefix
 app = FastAPI()
+instrument(app)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # LLM Integration
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
+LLM_PROVIDER = "openai"
+LLM_MODEL = "gpt-5"
+# Bump whenever the system message or analysis prompt changes so cached analyses are not reused
+ANALYSIS_PROMPT_VERSION = "3"
 
-# Initialize LLM Chat
-llm_chat = LlmChat(
-    api_key=EMERGENT_LLM_KEY,
-    session_id="dropout_prediction_system",
-    system_message="""You are an AI assistant specialized in educational data analysis and dropout risk prediction. 
+ANALYSIS_SYSTEM_MESSAGE = """You are an AI assistant specialized in educational data analysis and dropout risk prediction. 
     Your role is to analyze student data including attendance, test scores, fee payments, and academic attempts to predict dropout risk.
     
-    Provide risk assessments in the following format:
-    - Risk Level: LOW/MEDIUM/HIGH
-    - Risk Score: 0-100
-    - Key Risk Factors: List the main concerns
-    - Recommendations: Specific counseling recommendations
-    - Intervention Priority: IMMEDIATE/MODERATE/LOW
+    Provide each risk assessment as JSON: risk_level (LOW/MEDIUM/HIGH), risk_score (0-100),
+    risk_factors (the main concerns), recommendations (specific counseling recommendations),
+    intervention_priority (IMMEDIATE/MODERATE/LOW) and a short summary of your reasoning.
     
     Consider these factors:
     - Attendance below 75% = HIGH risk factor
     - Declining test scores = MEDIUM-HIGH risk factor  
     - Multiple failed attempts per subject = HIGH risk factor
     - Fee payment delays = MEDIUM risk factor
-    - Combination of factors increases overall risk significantly"""
-).with_model("openai", "gpt-5")
+    - Combination of factors increases overall risk significantly
+    
+    """ + OUTPUT_INSTRUCTIONS
+
+# Initialize LLM Chat: a fresh session per analysis, with shared limits
+llm_pool = LlmPool(EMERGENT_LLM_KEY, ANALYSIS_SYSTEM_MESSAGE, LLM_PROVIDER, LLM_MODEL)
 
 # Define Models
 class Student(BaseModel):
@@ -107,6 +144,8 @@ class RiskAssessment(BaseModel):
     intervention_priority: str  # IMMEDIATE, MODERATE, LOW
     assessment_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     ai_analysis: str
+    scoring_method: str = "llm"  # llm, rules
+    prompt_tokens: Optional[int] = None  # estimated size of the LLM prompt
 
 class Notification(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -117,211 +156,410 @@ class Notification(BaseModel):
     is_read: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class IngestJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    type: str  # students, attendance, assessments, fees
+    filename: Optional[str] = None
+    mode: str = "insert"  # insert, upsert
+    status: str = "queued"  # queued, running, completed, failed
+    rows_read: int = 0
+    inserted: int = 0
+    rejected: int = 0
+    errors: List[Dict[str, Any]] = []
+    detail: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ExportJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    collection: str  # students, attendance, assessments, fees
+    format: str = "parquet"  # parquet, arrow
+    incremental: bool = False
+    status: str = "queued"  # queued, running, completed, failed
+    filename: Optional[str] = None
+    rows: int = 0
+    bytes: Optional[int] = None
+    detail: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 # Upload endpoints
-@api_router.post("/upload/students")
-async def upload_students(file: UploadFile = File(...)):
+# Uploads run inside the request by default: the frontend reports success and
+# reloads its lists as soon as the upload answers, so it needs the rows to be
+# written by then. Parsing runs on the parse executor either way, so inline
+# uploads do not block the event loop; background=true queues an ingest job.
+UPLOAD_BACKGROUND = Query(False, description="Queue the file as an ingest job and answer 202 with its id; "
+                                             "poll /api/jobs/{id} for status, row counts and errors")
+
+def _upload_cache_tags(schema_name: str):
+    # Only student uploads change what the cached routes show (names, totals)
+    return ("students", "dashboard") if schema_name == "students" else ()
+
+async def _parse_slot():
+    """Dependency of every upload route: hold a parsing slot for the request, or answer 503."""
     try:
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        students = []
-        for _, row in df.iterrows():
-            student = Student(
-                student_id=str(row['student_id']),
-                name=str(row['name']),
-                email=str(row['email']),
-                phone=str(row.get('phone', '')),
-                course=str(row['course']),
-                semester=int(row['semester'])
-            )
-            students.append(student.dict())
-        
-        # Insert into database
-        await db.students.insert_many(students)
-        return {"message": f"Successfully uploaded {len(students)} students"}
-    
+        await parse_executor.acquire()
+    except ParserBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, round(PARSE_QUEUE_TIMEOUT)))})
+    try:
+        yield
+    finally:
+        parse_executor.release()
+
+async def _queue_ingest_job(file: UploadFile, schema_name: str, mode: str):
+    # Spool to a named file the worker process can open after this request ends
+    suffix = Path(file.filename or "").suffix
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        await parse_executor.run_local(shutil.copyfileobj, file.file, tmp)
+
+    job = IngestJob(type=schema_name, filename=file.filename, mode=mode)
+    await db.ingest_jobs.insert_one(job.dict())
+    submit_ingest_job(db, job.id, schema_name, tmp.name, file.filename, mongo_url, os.environ['DB_NAME'], mode,
+                      on_done=partial(response_cache.invalidate, *_upload_cache_tags(schema_name)))
+    return JSONResponse(status_code=202, content={
+        "message": f"Upload queued as job {job.id}",
+        "job_id": job.id,
+        "status": job.status,
+    })
+
+async def _ingest_upload(file: UploadFile, schema_name: str, label: str, background: bool = False, mode: str = "insert"):
+    # mode=upsert matches rows on their natural key so re-uploads update instead of duplicating
+    if mode not in INGEST_MODES:
+        raise ValueError(f"mode must be one of: {', '.join(INGEST_MODES)}")
+    if background:
+        return await _queue_ingest_job(file, schema_name, mode)
+    started = time.perf_counter()
+    contents = await file.read()
+    on_write = partial(update_features, db, schema_name)
+    result = await ingest_file(db[schema_name], schema_name, contents, started=started, mode=mode, on_write=on_write)
+    observe_upload(schema_name, result)
+    if schema_name == "students":
+        await increment_stats(db, total_students=result["inserted"])
+    await response_cache.invalidate(*_upload_cache_tags(schema_name))
+    return {"message": f"Successfully uploaded {result['inserted']} {label}", **result}
+
+@api_router.post("/upload/students", dependencies=[Depends(_parse_slot)])
+async def upload_students(file: UploadFile = File(...), background: bool = UPLOAD_BACKGROUND, mode: str = "insert"):
+    try:
+        return await _ingest_upload(file, "students", "students", background, mode)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
 
-@api_router.post("/upload/attendance")
-async def upload_attendance(file: UploadFile = File(...)):
+@api_router.post("/upload/attendance", dependencies=[Depends(_parse_slot)])
+async def upload_attendance(file: UploadFile = File(...), background: bool = UPLOAD_BACKGROUND, mode: str = "insert"):
     try:
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        attendance_records = []
-        for _, row in df.iterrows():
-            attendance = StudentAttendance(
-                student_id=str(row['student_id']),
-                subject=str(row['subject']),
-                total_classes=int(row['total_classes']),
-                attended_classes=int(row['attended_classes']),
-                attendance_percentage=float(row['attendance_percentage']),
-                month=str(row['month']),
-                year=int(row['year'])
-            )
-            attendance_records.append(attendance.dict())
-        
-        await db.attendance.insert_many(attendance_records)
-        return {"message": f"Successfully uploaded {len(attendance_records)} attendance records"}
-    
+        return await _ingest_upload(file, "attendance", "attendance records", background, mode)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing attendance file: {str(e)}")
 
-@api_router.post("/upload/assessments")
-async def upload_assessments(file: UploadFile = File(...)):
+@api_router.post("/upload/assessments", dependencies=[Depends(_parse_slot)])
+async def upload_assessments(file: UploadFile = File(...), background: bool = UPLOAD_BACKGROUND, mode: str = "insert"):
     try:
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        assessments = []
-        for _, row in df.iterrows():
-            assessment = StudentAssessment(
-                student_id=str(row['student_id']),
-                subject=str(row['subject']),
-                assessment_type=str(row['assessment_type']),
-                score=float(row['score']),
-                max_score=float(row['max_score']),
-                percentage=float(row['percentage']),
-                date=pd.to_datetime(row['date']),
-                attempt_number=int(row.get('attempt_number', 1))
-            )
-            assessments.append(assessment.dict())
-        
-        await db.assessments.insert_many(assessments)
-        return {"message": f"Successfully uploaded {len(assessments)} assessment records"}
-    
+        return await _ingest_upload(file, "assessments", "assessment records", background, mode)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing assessments file: {str(e)}")
 
-@api_router.post("/upload/fees")
-async def upload_fees(file: UploadFile = File(...)):
+@api_router.post("/upload/fees", dependencies=[Depends(_parse_slot)])
+async def upload_fees(file: UploadFile = File(...), background: bool = UPLOAD_BACKGROUND, mode: str = "insert"):
     try:
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        fee_records = []
-        for _, row in df.iterrows():
-            fee = FeePayment(
-                student_id=str(row['student_id']),
-                amount_due=float(row['amount_due']),
-                amount_paid=float(row.get('amount_paid', 0)),
-                due_date=pd.to_datetime(row['due_date']),
-                paid_date=pd.to_datetime(row['paid_date']) if pd.notna(row.get('paid_date')) else None,
-                status=str(row['status']),
-                semester=int(row['semester'])
-            )
-            fee_records.append(fee.dict())
-        
-        await db.fees.insert_many(fee_records)
-        return {"message": f"Successfully uploaded {len(fee_records)} fee records"}
-    
+        return await _ingest_upload(file, "fees", "fee records", background, mode)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing fees file: {str(e)}")
 
+# Bundle upload: all four sheets at once, as a .zip of files or one workbook with a sheet per type
+@api_router.post("/upload/bundle", dependencies=[Depends(_parse_slot)])
+async def upload_bundle(file: UploadFile = File(...), mode: str = "insert"):
+    if mode not in INGEST_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(INGEST_MODES)}")
+    try:
+        result = await ingest_bundle(db, await file.read(), file.filename, mode)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing bundle: {str(e)}")
+
+    for schema_name, sheet in result["sheets"].items():
+        observe_upload(schema_name, sheet)
+    if "students" in result["sheets"]:
+        await increment_stats(db, total_students=result["sheets"]["students"]["inserted"])
+        await response_cache.invalidate(*_upload_cache_tags("students"))
+    return {"message": f"Uploaded {result['inserted']} rows from {len(result['sheets'])} sheets", **result}
+
+# Streaming upload endpoints for very large sheets (.csv or .xlsx)
+@api_router.post("/upload/{schema_name}/stream", dependencies=[Depends(_parse_slot)])
+async def upload_stream(schema_name: str, file: UploadFile = File(...), upload_id: Optional[str] = None, mode: str = "insert"):
+    if schema_name not in SCHEMAS:
+        raise HTTPException(status_code=404, detail=f"Unknown upload type: {schema_name}")
+    if mode not in INGEST_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(INGEST_MODES)}")
+
+    filename = (file.filename or "").lower()
+    if filename.endswith(".csv") or file.content_type == "text/csv":
+        frames = iter_csv_frames(file.file, schema_name)
+    elif filename.endswith(".xlsx"):
+        frames = iter_xlsx_frames(file.file)
+    else:
+        raise HTTPException(status_code=400, detail="Streaming uploads support .csv and .xlsx files")
+
+    progress = track_upload(upload_id or str(uuid.uuid4()), schema_name, file.filename, mode)
+    try:
+        return await ingest_stream(db[schema_name], schema_name, frames, progress, mode, partial(update_features, db, schema_name))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing {schema_name} file: {str(e)}")
+    finally:
+        observe_upload(schema_name, progress)
+        if schema_name == "students":
+            await increment_stats(db, total_students=progress["inserted"])
+        await response_cache.invalidate(*_upload_cache_tags(schema_name))
+
+@api_router.get("/upload/progress/{upload_id}")
+async def get_upload_progress(upload_id: str):
+    progress = upload_progress.get(upload_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return progress
+
+# Ingest job endpoints
+@api_router.get("/jobs")
+async def get_ingest_jobs(limit: int = 20):
+    try:
+        jobs = await db.ingest_jobs.find({}, {"_id": 0}).sort("created_at", -1).to_list(min(limit, 100))
+        return jobs
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching jobs: {str(e)}")
+
+@api_router.get("/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    job = await db.ingest_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Export endpoints
+@api_router.post("/exports/{collection_name}")
+async def create_export(collection_name: str, format: str = "parquet", incremental: bool = False):
+    """Export a collection to a columnar file in the background.
+
+    With incremental=true only rows inserted or upserted since the last
+    completed export of the same collection and format are written.
+    """
+    if collection_name not in EXPORT_COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown collection. Use one of: {', '.join(EXPORT_COLLECTIONS)}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if not export_available():
+        raise HTTPException(status_code=501, detail="Exports need pyarrow installed on the server")
+
+    try:
+        export = ExportJob(collection=collection_name, format=format, incremental=incremental)
+        await db.exports.insert_one(export.dict())
+        submit_export(db, export.id, collection_name, format, incremental)
+        return JSONResponse(status_code=202, content={
+            "message": f"Export queued as {export.id}",
+            "export_id": export.id,
+            "status_url": f"/api/exports/{export.id}",
+            "download_url": f"/api/exports/{export.id}/download"
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error starting export: {str(e)}")
+
+@api_router.get("/exports")
+async def get_exports(limit: int = 20):
+    try:
+        return await db.exports.find({}, {"_id": 0}).sort("created_at", -1).to_list(min(limit, 100))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching exports: {str(e)}")
+
+@api_router.get("/exports/{export_id}")
+async def get_export(export_id: str):
+    export = await db.exports.find_one({"id": export_id}, {"_id": 0})
+    if not export:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return export
+
+@api_router.get("/exports/{export_id}/download")
+async def download_export(export_id: str):
+    export = await db.exports.find_one({"id": export_id}, {"_id": 0})
+    if not export:
+        raise HTTPException(status_code=404, detail="Export not found")
+    found = export_file(export)
+    if found is None:
+        raise HTTPException(status_code=409, detail=f"Export is {export['status']} and has no file to download")
+    path, media_type = found
+    return FileResponse(path, media_type=media_type, filename=export["filename"])
+
 # Analysis endpoints
+ANALYZE_MAX_CONCURRENCY = int(os.environ.get('ANALYZE_MAX_CONCURRENCY', 8))
+ANALYZE_WRITE_BATCH_SIZE = int(os.environ.get('ANALYZE_WRITE_BATCH_SIZE', 100))
+
+LLM_MODES = ("auto", "always", "never")  # auto: only borderline or HIGH rule scores go to the LLM
+
+class BatchAnalysisRequest(BaseModel):
+    course: Optional[str] = None
+    semester: Optional[int] = None
+    student_ids: Optional[List[str]] = None  # omit all filters to analyze every student
+    concurrency: int = 4
+    llm: str = "auto"
+    refresh: bool = False  # bypass the analysis cache
+
+class MarkNotificationsReadRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    student_id: Optional[str] = None
+    type: Optional[str] = None
+    priority: Optional[str] = None
+    before: Optional[datetime] = None  # created before
+    all: bool = False  # required to mark everything read with no other filter
+
+class ScoreAllRequest(BaseModel):
+    course: Optional[str] = None
+    semester: Optional[int] = None
+
+def _student_query(course: Optional[str] = None, semester: Optional[int] = None, student_ids: Optional[List[str]] = None):
+    query = {}
+    if course:
+        query["course"] = course
+    if semester is not None:
+        query["semester"] = semester
+    if student_ids:
+        query["student_id"] = {"$in": student_ids}
+    return query
+
+def _rules_assessment(student_id: str, scored) -> RiskAssessment:
+    return RiskAssessment(
+        student_id=student_id,
+        risk_level=scored["risk_level"],
+        risk_score=float(scored["risk_score"]),
+        risk_factors=scored["risk_factors"],
+        recommendations=scored["recommendations"],
+        intervention_priority=scored["intervention_priority"],
+        ai_analysis="Rule-based assessment: " + ("; ".join(scored["risk_factors"]) or "no risk factors found"),
+        scoring_method="rules"
+    )
+
+def _risk_notification(student_id: str, name: str) -> Notification:
+    return Notification(
+        student_id=student_id,
+        message=f"HIGH RISK ALERT: {name} requires immediate intervention",
+        type="risk_alert",
+        priority="high"
+    )
+
+def _needs_llm(llm_mode: str, scored) -> bool:
+    return llm_mode == "always" or (llm_mode == "auto" and bool(scored["needs_review"]))
+
+async def _run_risk_analysis(student: Dict[str, Any], llm_mode: str = "auto", refresh: bool = False,
+                             scored=None, profile: Optional[Dict[str, Any]] = None):
+    """Score one student without writing anything.
+
+    The rules engine always runs; the LLM is only called when llm_mode is
+    "always", or "auto" and the rule score is borderline or HIGH. LLM
+    responses are cached by a hash of the student's data unless refresh is
+    set. Batch callers pass the rules score and profile they bulk-loaded.
+    Returns the RiskAssessment and, for HIGH risk, the Notification to
+    save.
+    """
+    student_id = student['student_id']
+
+    # Rules scoring reads the precomputed feature document only
+    if scored is None:
+        if llm_mode == "always" and profile is None:
+            # Both are needed either way; fetch them concurrently
+            features, profile = await asyncio.gather(load_features(db, [student_id]), load_profile(db, student_id, student))
+        else:
+            features = await load_features(db, [student_id])
+        scored = score_features(features).iloc[0]
+    if not _needs_llm(llm_mode, scored):
+        risk_assessment = _rules_assessment(student_id, scored)
+        notification = _risk_notification(student_id, student['name']) if risk_assessment.risk_level == "HIGH" else None
+        return risk_assessment, notification
+
+    # Get all related data, projected to what the prompt uses
+    if profile is None:
+        profile = await load_profile(db, student_id, student)
+
+    # AI Analysis on a compact, token-bounded summary of the history
+    analysis_prompt, student_data = build_analysis_prompt(
+        student, profile["attendance"], profile["assessments"], profile["fees"], scored
+    )
+    prompt_tokens = estimate_tokens(analysis_prompt)
+
+    model = f"{LLM_PROVIDER}/{LLM_MODEL}"
+    key = cache_key(student_data, ANALYSIS_PROMPT_VERSION, model)
+    ai_response = None if refresh else await get_cached_analysis(db.analysis_cache, key)
+    parsed, fallback_note = None, "LLM reply could not be parsed. "
+    if ai_response is not None:
+        try:
+            parsed = parse_risk_output(ai_response)
+        except ValueError:
+            ai_response = None
+    if ai_response is None:
+        chat = llm_pool.session()
+
+        async def ask(text):
+            return await call_with_retry(lambda: llm_pool.send(chat, text))
+
+        try:
+            reply = await ask(analysis_prompt)
+            record_prompt(prompt_tokens, student_data.get("truncated", False))
+            parsed, ai_response = await parse_with_repair(reply, ask)
+        except CircuitOpenError:
+            fallback_note = "LLM temporarily unavailable. "
+        # Only replies that parsed are worth reusing
+        if parsed is not None:
+            await store_analysis(db.analysis_cache, key, ai_response, student_id, ANALYSIS_PROMPT_VERSION, model)
+
+    if parsed is None:
+        # No usable LLM reply (malformed after the repair retry, or circuit open): fall back to the rules engine
+        risk_assessment = _rules_assessment(student_id, scored)
+        risk_assessment.ai_analysis = fallback_note + risk_assessment.ai_analysis
+        risk_assessment.prompt_tokens = prompt_tokens
+    else:
+        risk_assessment = RiskAssessment(
+            student_id=student_id,
+            risk_level=parsed["risk_level"],
+            risk_score=parsed["risk_score"],
+            risk_factors=parsed["risk_factors"] or scored["risk_factors"],
+            recommendations=parsed["recommendations"] or scored["recommendations"],
+            intervention_priority=parsed["intervention_priority"],
+            ai_analysis=parsed["summary"],
+            prompt_tokens=prompt_tokens
+        )
+
+    # Create notification if high risk
+    notification = _risk_notification(student_id, student['name']) if risk_assessment.risk_level == "HIGH" else None
+
+    return risk_assessment, notification
+
+def _publish_analysis(assessments: List[Dict[str, Any]], notifications: List[Dict[str, Any]]):
+    # Push new assessments and notifications to /api/events subscribers
+    for assessment in assessments:
+        event_broker.publish("risk_update", {
+            field: assessment[field]
+            for field in ("id", "student_id", "risk_level", "risk_score", "intervention_priority", "scoring_method", "assessment_date")
+        })
+    for notification in notifications:
+        event_broker.publish("notification", {key: value for key, value in notification.items() if key != "_id"})
+
 @api_router.post("/analyze/student/{student_id}")
-async def analyze_student_risk(student_id: str):
+async def analyze_student_risk(student_id: str, llm: str = "auto", refresh: bool = False):
+    if llm not in LLM_MODES:
+        raise HTTPException(status_code=400, detail=f"llm must be one of: {', '.join(LLM_MODES)}")
     try:
         # Get student data
-        student = await db.students.find_one({"student_id": student_id})
+        student = await db.students.find_one({"student_id": student_id}, STUDENT_PROJECTION)
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
-        
-        # Get all related data
-        attendance = await db.attendance.find({"student_id": student_id}).to_list(None)
-        assessments = await db.assessments.find({"student_id": student_id}).to_list(None)
-        fees = await db.fees.find({"student_id": student_id}).to_list(None)
-        
-        # Prepare data for AI analysis
-        student_data = {
-            "student_info": {
-                "name": student['name'],
-                "course": student['course'],
-                "semester": student['semester']
-            },
-            "attendance_summary": [],
-            "assessment_summary": [],
-            "fee_summary": []
-        }
-        
-        # Process attendance data
-        for att in attendance:
-            student_data["attendance_summary"].append({
-                "subject": att['subject'],
-                "attendance_percentage": att['attendance_percentage'],
-                "month": att['month'],
-                "year": att['year']
-            })
-        
-        # Process assessment data
-        for ass in assessments:
-            student_data["assessment_summary"].append({
-                "subject": ass['subject'],
-                "type": ass['assessment_type'],
-                "percentage": ass['percentage'],
-                "attempt_number": ass['attempt_number'],
-                "date": ass['date'].isoformat() if isinstance(ass['date'], datetime) else str(ass['date'])
-            })
-        
-        # Process fee data
-        for fee in fees:
-            student_data["fee_summary"].append({
-                "amount_due": fee['amount_due'],
-                "amount_paid": fee['amount_paid'],
-                "status": fee['status'],
-                "semester": fee['semester']
-            })
-        
-        # AI Analysis
-        analysis_prompt = f"""
-        Analyze this student's data for dropout risk:
-        
-        Student Data: {json.dumps(student_data, indent=2)}
-        
-        Please provide a comprehensive risk assessment following the specified format.
-        """
-        
-        user_message = UserMessage(text=analysis_prompt)
-        ai_response = await llm_chat.send_message(user_message)
-        
-        # Parse AI response (simplified - in production, you'd want more robust parsing)
-        ai_text = ai_response
-        
-        # Extract risk level and score (basic parsing)
-        risk_level = "MEDIUM"  # Default
-        risk_score = 50.0  # Default
-        
-        if "HIGH" in ai_text.upper():
-            risk_level = "HIGH"
-            risk_score = 80.0
-        elif "LOW" in ai_text.upper():
-            risk_level = "LOW"
-            risk_score = 25.0
-        
-        # Create risk assessment
-        risk_assessment = RiskAssessment(
-            student_id=student_id,
-            risk_level=risk_level,
-            risk_score=risk_score,
-            risk_factors=["Low attendance", "Declining scores", "Fee delays"],  # Simplified
-            recommendations=["Immediate counseling", "Academic support", "Financial assistance"],  # Simplified
-            intervention_priority="MODERATE" if risk_level == "MEDIUM" else risk_level.lower().capitalize(),
-            ai_analysis=ai_text
-        )
-        
+
+        risk_assessment, notification = await _run_risk_analysis(student, llm, refresh)
+
         # Save assessment
-        await db.risk_assessments.insert_one(risk_assessment.dict())
-        
-        # Create notification if high risk
-        if risk_level == "HIGH":
-            notification = Notification(
-                student_id=student_id,
-                message=f"HIGH RISK ALERT: {student['name']} requires immediate intervention",
-                type="risk_alert",
-                priority="high"
-            )
+        await record_assessments(db, [risk_assessment.dict()])
+        await apply_risk_levels(db, [risk_assessment.dict()])
+        if notification:
             await db.notifications.insert_one(notification.dict())
+            await increment_stats(db, unread_notifications=1)
+        await response_cache.invalidate("risk_assessments", "dashboard", *(("notifications",) if notification else ()))
+        _publish_analysis([risk_assessment.dict()], [notification.dict()] if notification else [])
         
         return risk_assessment.dict()
     
@@ -330,138 +568,524 @@ async def analyze_student_risk(student_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing student: {str(e)}")
 
+async def _student_batches(query: Dict[str, Any], size: int):
+    batch = []
+    async for student in db.students.find(query, STUDENT_PROJECTION):
+        batch.append(student)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@api_router.post("/analyze/batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """Analyze a cohort with bounded concurrency, streaming NDJSON progress."""
+    if request.llm not in LLM_MODES:
+        raise HTTPException(status_code=400, detail=f"llm must be one of: {', '.join(LLM_MODES)}")
+    query = _student_query(request.course, request.semester, request.student_ids)
+
+    try:
+        total = await db.students.count_documents(query)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error starting batch analysis: {str(e)}")
+    concurrency = max(1, min(request.concurrency, ANALYZE_MAX_CONCURRENCY))
+
+    async def analyze_one(student, scored, profile):
+        try:
+            return student['student_id'], await _run_risk_analysis(student, request.llm, request.refresh, scored, profile), None
+        except Exception as e:
+            return student['student_id'], None, str(e)
+
+    async def run():
+        started = time.perf_counter()
+        summary = {"total": total, "processed": 0, "failed": 0, "HIGH": 0, "MEDIUM": 0, "LOW": 0}
+        assessments = []
+        pending = set()
+
+        async def notifications_written(notifications):
+            await response_cache.invalidate("notifications", "dashboard")
+            _publish_analysis([], notifications)
+
+        # HIGH-risk alerts go out within NOTIFICATION_FLUSH_SECONDS, not only with the assessment batches
+        notification_writer = NotificationWriter(db, on_flush=notifications_written)
+
+        async def flush():
+            if assessments:
+                await record_assessments(db, assessments)
+                await apply_risk_levels(db, assessments)
+                await response_cache.invalidate("risk_assessments", "dashboard")
+                _publish_analysis(assessments, [])
+                assessments.clear()
+
+        def record(task):
+            student_id, result, error = task.result()
+            summary["processed"] += 1
+            event = {"event": "progress", "student_id": student_id, "processed": summary["processed"], "total": total}
+            if error:
+                summary["failed"] += 1
+                event["error"] = error
+            else:
+                risk_assessment, notification = result
+                summary[risk_assessment.risk_level] += 1
+                event["risk_level"] = risk_assessment.risk_level
+                assessments.append(risk_assessment.dict())
+                if notification:
+                    notification_writer.add(notification.dict())
+            return json.dumps(event) + "\n"
+
+        yield json.dumps({"event": "started", "total": total, "concurrency": concurrency}) + "\n"
+        try:
+            async for students in _student_batches(query, PROFILE_BATCH_SIZE):
+                # One feature query and one profile query per collection for the whole batch
+                scores = score_features(await load_features(db, [student["student_id"] for student in students]))
+                profiles = await load_profiles(db, students=[
+                    student for student in students if _needs_llm(request.llm, scores.loc[student["student_id"]])
+                ])
+                for student in students:
+                    if len(pending) >= concurrency:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            yield record(task)
+                        if len(assessments) >= ANALYZE_WRITE_BATCH_SIZE:
+                            await flush()
+                        await notification_writer.flush_if_due()
+                    student_id = student["student_id"]
+                    pending.add(asyncio.create_task(analyze_one(student, scores.loc[student_id], profiles.get(student_id))))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield record(task)
+                if len(assessments) >= ANALYZE_WRITE_BATCH_SIZE:
+                    await flush()
+                await notification_writer.flush_if_due()
+            await flush()
+            await notification_writer.flush()
+        finally:
+            # Client went away or a write failed; don't leave LLM calls running
+            for task in pending:
+                task.cancel()
+
+        summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        yield json.dumps({"event": "done", **summary}) + "\n"
+
+    return StreamingResponse(run(), media_type="application/x-ndjson")
+
+@api_router.post("/analyze/score-all")
+async def score_all_students(request: ScoreAllRequest):
+    """Re-score every matching student with the rules engine in one pass.
+
+    Students whose score is borderline or HIGH are returned in needs_review so
+    they can be sent on to /analyze/batch with llm="always".
+    """
+    try:
+        started = time.perf_counter()
+        query = _student_query(request.course, request.semester)
+        students = await db.students.find(query, {"_id": 0, "student_id": 1, "name": 1}).to_list(None)
+        if not students:
+            return {"scored": 0, "risk_distribution": {"high": 0, "medium": 0, "low": 0}, "needs_review": []}
+
+        students_df = pd.DataFrame(students)
+        scores = score_features(await load_features(db, students_df["student_id"]))
+        names = students_df.drop_duplicates("student_id").set_index("student_id")["name"]
+
+        assessments_out = [
+            _rules_assessment(student_id, scored).dict()
+            for student_id, scored in zip(scores.index, scores.to_dict("records"))
+        ]
+        await record_assessments(db, assessments_out)
+        transitions = await apply_risk_levels(db, assessments_out)
+
+        # Alert only students who just moved into HIGH, not every HIGH student on every run
+        notification_writer = NotificationWriter(db, flush_size=INGEST_CHUNK_SIZE)
+        for student_id, (_, level) in transitions.items():
+            if level == "HIGH":
+                notification_writer.add(_risk_notification(student_id, names[student_id]).dict())
+        inserted_notifications = await notification_writer.flush()
+        await response_cache.invalidate("risk_assessments", "notifications", "dashboard")
+
+        levels = scores["risk_level"].value_counts()
+        distribution = {
+            "high": int(levels.get("HIGH", 0)),
+            "medium": int(levels.get("MEDIUM", 0)),
+            "low": int(levels.get("LOW", 0))
+        }
+        # One summary event instead of one per student; clients reload their lists
+        event_broker.publish("bulk_update", {
+            "scored": len(scores),
+            "risk_distribution": distribution,
+            "notifications": inserted_notifications
+        })
+        return {
+            "scored": len(scores),
+            "risk_distribution": distribution,
+            "needs_review": scores.index[scores["needs_review"]].tolist(),
+            "elapsed_seconds": round(time.perf_counter() - started, 3)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error scoring students: {str(e)}")
+
+@api_router.get("/llm/stats")
+async def get_llm_stats():
+    prompts, parses = prompt_stats(), parse_stats()
+    replies = sum(parses.values())
+    return {
+        **prompts,
+        "avg_tokens": round(prompts["total_tokens"] / prompts["prompts"], 1) if prompts["prompts"] else None,
+        "token_budget": PROMPT_TOKEN_BUDGET,
+        "parse": parses,
+        "parse_failure_rate": round(parses["failed"] / replies, 4) if replies else None,
+        "pool": llm_pool.stats()
+    }
+
+@api_router.get("/analysis-cache/stats")
+async def get_analysis_cache_stats():
+    try:
+        cache = cache_stats()
+        lookups = cache["hits"] + cache["misses"]
+        return {
+            **cache,
+            "hit_rate": round(cache["hits"] / lookups, 4) if lookups else None,
+            "entries": await db.analysis_cache.estimated_document_count()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching cache stats: {str(e)}")
+
 # Dashboard endpoints
 @api_router.get("/dashboard/overview")
-async def get_dashboard_overview():
-    try:
-        total_students = await db.students.count_documents({})
-        high_risk = await db.risk_assessments.count_documents({"risk_level": "HIGH"})
-        medium_risk = await db.risk_assessments.count_documents({"risk_level": "MEDIUM"})
-        low_risk = await db.risk_assessments.count_documents({"risk_level": "LOW"})
-        unread_notifications = await db.notifications.count_documents({"is_read": False})
-        
+async def get_dashboard_overview(request: Request):
+    async def build(headers):
+        # Counters are maintained incrementally by the write paths; risk
+        # distribution counts each student's current level
+        stats = await get_stats(db)
         return {
-            "total_students": total_students,
-            "risk_distribution": {
-                "high": high_risk,
-                "medium": medium_risk,
-                "low": low_risk
-            },
-            "unread_notifications": unread_notifications
+            "total_students": stats["total_students"],
+            "risk_distribution": stats["risk_distribution"],
+            "unread_notifications": stats["unread_notifications"],
+            "updated_at": stats["updated_at"]
         }
+
+    try:
+        return await response_cache.respond(request, ("dashboard",), build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching dashboard data: {str(e)}")
 
+AT_RISK_SORT_FIELDS = ("assessment_date", "risk_score")
+AT_RISK_MAX_LIMIT = 5000
+
 @api_router.get("/students/at-risk")
-async def get_at_risk_students():
+async def get_at_risk_students(
+    request: Request,
+    risk_level: Optional[str] = None,  # comma separated, e.g. HIGH,MEDIUM
+    course: Optional[str] = None,
+    sort: str = "assessment_date",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+):
+    """Latest assessment per student, newest (or riskiest) first.
+
+    Without limit or cursor every student is returned, as before paging was
+    added. Otherwise returns a page; when more rows remain, the
+    X-Next-Cursor response header carries the cursor for the next page.
+    """
+    if sort not in AT_RISK_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(AT_RISK_SORT_FIELDS)}")
+    levels = [level.strip().upper() for level in risk_level.split(",")] if risk_level else ["HIGH", "MEDIUM", "LOW"]
+    if limit is not None or cursor:
+        limit = max(1, min(limit or AT_RISK_MAX_LIMIT, AT_RISK_MAX_LIMIT))
     try:
-        # Get recent risk assessments
-        risk_assessments = await db.risk_assessments.find().sort("assessment_date", -1).to_list(None)
-        
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def build(headers):
+        # db.risk_latest holds one assessment per student, indexed by risk level and sort field
+        pipeline = [{"$match": {"risk_level": {"$in": levels}}}]
+        if after:
+            pipeline.append({"$match": keyset_filter(sort, True, after, "student_id")})
+        pipeline.append({"$sort": {sort: -1, "student_id": 1}})
+
+        lookup = [
+            {"$lookup": {"from": "students", "localField": "student_id", "foreignField": "student_id", "as": "student"}},
+            {"$unwind": {"path": "$student", "preserveNullAndEmptyArrays": True}},
+        ]
+        page_limit = [{"$limit": limit + 1}] if limit else []
+        if course:
+            pipeline += lookup + [{"$match": {"student.course": course}}] + page_limit
+        else:
+            # Only join the page we are about to return
+            pipeline += page_limit + lookup
+        pipeline.append({"$project": {
+            "_id": 0,
+            "student_id": 1,
+            "name": "$student.name",
+            "course": "$student.course",
+            "risk_level": 1,
+            "risk_score": 1,
+            "risk_factors": 1,
+            "intervention_priority": 1,
+            "assessment_date": 1
+        }})
+
+        rows = await db.risk_latest.aggregate(pipeline).to_list(limit + 1 if limit else None)
+        page = rows[:limit] if limit else rows
+        if limit and len(rows) > limit:
+            headers["X-Next-Cursor"] = encode_cursor({sort: page[-1][sort], "student_id": page[-1]["student_id"]})
+
         at_risk_students = []
-        for assessment in risk_assessments:
-            if assessment['risk_level'] in ['HIGH', 'MEDIUM', 'LOW']:
-                student = await db.students.find_one({"student_id": assessment['student_id']})
-                if student:
-                    # Convert ObjectId to string
-                    if '_id' in assessment:
-                        assessment['_id'] = str(assessment['_id'])
-                    if '_id' in student:
-                        student['_id'] = str(student['_id'])
-                        
-                    student_risk = {
-                        "student_id": assessment['student_id'],
-                        "name": student['name'],
-                        "course": student['course'],
-                        "risk_level": assessment['risk_level'],
-                        "risk_score": assessment['risk_score'],
-                        "risk_factors": assessment['risk_factors'],
-                        "intervention_priority": assessment['intervention_priority'],
-                        "assessment_date": assessment['assessment_date'].isoformat() if isinstance(assessment['assessment_date'], datetime) else str(assessment['assessment_date'])
-                    }
-                    at_risk_students.append(student_risk)
-        
+        for row in page:
+            # Assessments whose student record no longer exists are skipped
+            if row.get("name") is None:
+                continue
+            if isinstance(row['assessment_date'], datetime):
+                row['assessment_date'] = row['assessment_date'].isoformat()
+            at_risk_students.append(row)
+
         return at_risk_students
+
+    try:
+        return await response_cache.respond(request, ("risk_assessments", "students"), build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching at-risk students: {str(e)}")
 
 @api_router.get("/notifications")
-async def get_notifications():
-    try:
+async def get_notifications(request: Request):
+    async def build(headers):
         notifications = await db.notifications.find().sort("created_at", -1).to_list(50)
         # Convert MongoDB ObjectId to string for JSON serialization
         for notification in notifications:
             if '_id' in notification:
                 notification['_id'] = str(notification['_id'])
         return notifications
+
+    try:
+        return await response_cache.respond(request, ("notifications",), build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching notifications: {str(e)}")
 
+@api_router.get("/events")
+async def stream_events(
+    request: Request,
+    types: Optional[str] = Query(None, description="Comma-separated event types, e.g. notification,risk_update"),
+    last_event_id: Optional[str] = Query(None, description="Resume point for clients that cannot send Last-Event-ID")
+):
+    """Server-sent events for notifications and risk updates, in place of polling.
+
+    Event types: notification, notifications_read, risk_update, bulk_update
+    and reset (the resume point was lost; reload the lists).
+    """
+    event_types = {name.strip() for name in types.split(",") if name.strip()} if types else None
+    return StreamingResponse(
+        event_broker.stream(request.headers.get("last-event-id") or last_event_id, event_types),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/notifications/unread-counts")
+async def get_unread_notification_counts(request: Request):
+    async def build(headers):
+        return await unread_counts(db)
+
+    try:
+        return await response_cache.respond(request, ("notifications",), build)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error counting notifications: {str(e)}")
+
+@api_router.put("/notifications/read")
+async def mark_notifications_read(request: MarkNotificationsReadRequest):
+    """Mark many notifications read in one update: by ids, by filter, or all."""
+    query = {}
+    if request.ids is not None:
+        query["id"] = {"$in": request.ids}
+    for field in ("student_id", "type", "priority"):
+        if getattr(request, field) is not None:
+            query[field] = getattr(request, field)
+    if request.before is not None:
+        query["created_at"] = {"$lt": request.before}
+    if not query and not request.all:
+        raise HTTPException(status_code=400, detail="Give ids or a filter, or set all to true")
+
+    try:
+        marked = await mark_read(db, query)
+        if marked:
+            await response_cache.invalidate("notifications", "dashboard")
+            event_broker.publish("notifications_read", {
+                **({"ids": request.ids} if request.ids is not None else {}),
+                "filter": request.dict(exclude_none=True, exclude={"ids"}),
+                "count": marked
+            })
+        return {"message": f"{marked} notifications marked as read", "marked": marked}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating notifications: {str(e)}")
+
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str):
     try:
-        await db.notifications.update_one(
-            {"id": notification_id},
-            {"$set": {"is_read": True}}
-        )
+        if await mark_read(db, {"id": notification_id}):
+            await response_cache.invalidate("notifications", "dashboard")
+            event_broker.publish("notifications_read", {"ids": [notification_id], "count": 1})
         return {"message": "Notification marked as read"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating notification: {str(e)}")
 
-@api_router.get("/students")
-async def get_all_students():
+async def _list_collection(collection, query, response: Response, fields, limit, cursor, output, error_label):
+    """Shared body of the list endpoints: a keyset page, or NDJSON with output=ndjson.
+
+    Pages are returned as a plain list; the X-Next-Cursor header carries the
+    cursor for the next page when there is one. Without limit or cursor the
+    whole collection is returned, which is what the frontend expects.
+    """
     try:
-        students = await db.students.find().to_list(None)
-        # Convert MongoDB ObjectId to string for JSON serialization
-        for student in students:
-            if '_id' in student:
-                student['_id'] = str(student['_id'])
-        return students
+        projection = parse_fields(fields)
+        if output == "ndjson":
+            return stream_ndjson(collection, query, projection, limit)
+        documents, next_cursor = await list_page(collection, query, projection, limit, cursor)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return documents
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching students: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"{error_label}: {str(e)}")
+
+@api_router.get("/students")
+async def get_all_students(
+    response: Response,
+    student_id: Optional[str] = None,
+    course: Optional[str] = None,
+    semester: Optional[int] = None,
+    fields: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format")
+):
+    query = build_query(student_id=student_id, course=course, semester=semester)
+    return await _list_collection(db.students, query, response, fields, limit, cursor, output, "Error fetching students")
 
 # New endpoints for data management pages
 @api_router.get("/assessments/all")
-async def get_all_assessments():
+async def get_all_assessments(
+    response: Response,
+    student_id: Optional[str] = None,
+    subject: Optional[str] = None,
+    assessment_type: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format")
+):
+    query = build_query("date", date_from, date_to, student_id=student_id, subject=subject, assessment_type=assessment_type)
+    return await _list_collection(db.assessments, query, response, fields, limit, cursor, output, "Error fetching assessments")
+
+@api_router.get("/fees/all")
+async def get_all_fees(
+    response: Response,
+    student_id: Optional[str] = None,
+    semester: Optional[int] = None,
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format")
+):
+    query = build_query("due_date", date_from, date_to, student_id=student_id, semester=semester, status=status)
+    return await _list_collection(db.fees, query, response, fields, limit, cursor, output, "Error fetching fees")
+
+@api_router.get("/attendance/all")
+async def get_all_attendance(
+    response: Response,
+    student_id: Optional[str] = None,
+    subject: Optional[str] = None,
+    month: Optional[str] = None,
+    year: Optional[int] = None,
+    fields: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format")
+):
+    query = build_query(student_id=student_id, subject=subject, month=month, year=year)
+    return await _list_collection(db.attendance, query, response, fields, limit, cursor, output, "Error fetching attendance")
+
+@api_router.get("/students/{student_id}/features")
+async def get_student_features(student_id: str):
     try:
-        assessments = await db.assessments.find().to_list(None)
-        # Convert MongoDB ObjectId and datetime to string for JSON serialization
-        for assessment in assessments:
-            if '_id' in assessment:
-                assessment['_id'] = str(assessment['_id'])
-            if 'date' in assessment and isinstance(assessment['date'], datetime):
-                assessment['date'] = assessment['date'].isoformat()
-        return assessments
+        report = await feature_report(db, student_id)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching assessments: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching student features: {str(e)}")
+    if report is None:
+        raise HTTPException(status_code=404, detail="No features recorded for this student")
+    return report
 
-@api_router.get("/fees/all")
-async def get_all_fees():
+@api_router.get("/students/{student_id}/risk-history")
+async def get_student_risk_history(
+    student_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    interval: Optional[str] = None,  # day, week or month: summarized series instead of points
+    include_detail: bool = False  # LLM analysis text and recommendations
+):
+    if interval is not None and interval not in HISTORY_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of: {', '.join(HISTORY_INTERVALS)}")
     try:
-        fees = await db.fees.find().to_list(None)
-        # Convert MongoDB ObjectId and datetime to string for JSON serialization
-        for fee in fees:
-            if '_id' in fee:
-                fee['_id'] = str(fee['_id'])
-            if 'due_date' in fee and isinstance(fee['due_date'], datetime):
-                fee['due_date'] = fee['due_date'].isoformat()
-            if 'paid_date' in fee and isinstance(fee['paid_date'], datetime):
-                fee['paid_date'] = fee['paid_date'].isoformat()
-        return fees
+        history = await risk_history(db, student_id, since, until, interval, include_detail)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching fees: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching risk history: {str(e)}")
+    if history is None:
+        raise HTTPException(status_code=404, detail="No risk assessments recorded for this student")
+    return history
 
-@api_router.get("/attendance/all")
-async def get_all_attendance():
+# Admin endpoints
+@api_router.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/admin/indexes")
+async def get_index_report():
     try:
-        attendance = await db.attendance.find().to_list(None)
-        # Convert MongoDB ObjectId to string for JSON serialization
-        for record in attendance:
-            if '_id' in record:
-                record['_id'] = str(record['_id'])
-        return attendance
+        return await index_report(db)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching attendance: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching index report: {str(e)}")
+
+@api_router.post("/admin/dashboard-stats/rebuild")
+async def rebuild_dashboard_stats():
+    try:
+        stats = await rebuild_stats(db)
+        await response_cache.invalidate("dashboard")
+        return stats
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rebuilding dashboard stats: {str(e)}")
+
+@api_router.post("/admin/risk-history/compact")
+async def compact_risk_history(older_than_days: Optional[int] = None):
+    try:
+        if older_than_days is None:
+            return await compact_history(db)
+        return await compact_history(db, older_than_days=older_than_days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error compacting risk history: {str(e)}")
+
+@api_router.post("/admin/risk-latest/rebuild")
+async def rebuild_risk_latest():
+    try:
+        result = await rebuild_latest(db)
+        await response_cache.invalidate("risk_assessments")
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rebuilding latest assessments: {str(e)}")
+
+@api_router.post("/admin/features/rebuild")
+async def rebuild_student_features():
+    try:
+        return await rebuild_features(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rebuilding student features: {str(e)}")
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -472,16 +1096,29 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+background_tasks = set()
+
+@app.on_event("startup")
+async def bootstrap_indexes():
+    await ensure_indexes(db)
+    await ensure_features(db)
+    await ensure_latest(db)
+
+@app.on_event("startup")
+async def start_event_loop_monitor():
+    background_tasks.add(asyncio.create_task(monitor_event_loop()))
+    if RISK_ARCHIVE_INTERVAL_HOURS > 0:
+        background_tasks.add(asyncio.create_task(compact_periodically(db)))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    event_broker.close()
+    for task in background_tasks:
+        task.cancel()
+    shutdown_jobs()
+    parse_executor.shutdown()
     client.close()
     
\ No newline at end of file
@@ -0,0 +1,363 @@
+"""Throughput/latency benchmark for the EduPredict backend.
+
+Runs the FastAPI app in-process against mongomock (or a local mongod with
+--mongo-url) and a stubbed LlmChat, so no network or API key is needed.
+Results are written as JSON; pass --baseline to compare with a previous run.
+With several sizes each cohort runs in its own process, so peak_rss_mb is
+that cohort's peak rather than the largest one so far.
+
+    python backend_bench.py --sizes 1000,10000 --output bench.json
+    python backend_bench.py --sizes 1000 --baseline bench.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+STUB_REPLY = json.dumps({
+    "risk_level": "MEDIUM",
+    "risk_score": 55,
+    "risk_factors": ["Attendance below 75%"],
+    "recommendations": ["Mentor follow-up"],
+    "intervention_priority": "MODERATE",
+    "summary": "Benchmark stub reply",
+})
+
+
+class StubLlmChat:
+    """Stands in for emergentintegrations' LlmChat; replies after `delay` seconds."""
+    delay = 0.0
+
+    def __init__(self, api_key=None, session_id=None, system_message=None):
+        self.session_id = session_id
+
+    def with_model(self, provider, model):
+        return self
+
+    async def send_message(self, message):
+        await asyncio.sleep(self.delay)
+        return STUB_REPLY
+
+
+class StubUserMessage:
+    def __init__(self, text):
+        self.text = text
+
+
+def _percentiles(samples):
+    values = np.array(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _use_mongomock():
+    import mongomock.collection
+    import motor.motor_asyncio
+    from mongomock_motor import AsyncMongoMockClient
+
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    # pymongo 4.9+ passes sort= to bulk updates, which mongomock does not accept yet
+    for name in ("add_update", "add_replace"):
+        original = getattr(mongomock.collection.BulkOperationBuilder, name)
+
+        def patched(self, *args, _original=original, sort=None, **kwargs):
+            return _original(self, *args, **kwargs)
+        setattr(mongomock.collection.BulkOperationBuilder, name, patched)
+
+
+def load_app(mongo_url=None):
+    """Import the server with a stubbed LLM and the chosen Mongo backend."""
+    os.environ.setdefault("MONGO_URL", mongo_url or "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "edupredict_bench")
+    if mongo_url is None:
+        _use_mongomock()
+    try:
+        import emergentintegrations.llm.chat  # noqa: F401
+    except ImportError:
+        chat = types.ModuleType("emergentintegrations.llm.chat")
+        chat.LlmChat, chat.UserMessage = StubLlmChat, StubUserMessage
+        sys.modules["emergentintegrations"] = types.ModuleType("emergentintegrations")
+        sys.modules["emergentintegrations.llm"] = types.ModuleType("emergentintegrations.llm")
+        sys.modules["emergentintegrations.llm.chat"] = chat
+
+    import llm_pool
+    import server
+    llm_pool.LlmChat = StubLlmChat
+    return server
+
+
+def generate_cohort(size, seed=42):
+    """Synthetic students with ~6 attendance, 6 assessment and 2 fee rows each."""
+    rng = np.random.default_rng(seed)
+    ids = np.array([f"B{index:07d}" for index in range(size)])
+    students = pd.DataFrame({
+        "student_id": ids,
+        "name": [f"Student {index}" for index in range(size)],
+        "email": [f"student{index}@example.edu" for index in range(size)],
+        "phone": "",
+        "course": rng.choice(["Computer Science", "Mechanical", "Commerce", "Biology"], size),
+        "semester": rng.integers(1, 9, size),
+    })
+
+    rows = size * 6
+    total = rng.integers(20, 31, rows)
+    attended = (total * rng.beta(6, 2, rows)).astype(int)
+    attendance = pd.DataFrame({
+        "student_id": np.repeat(ids, 6),
+        "subject": np.tile(["Mathematics", "Physics", "Chemistry"], size * 2),
+        "total_classes": total,
+        "attended_classes": attended,
+        "attendance_percentage": (attended / total * 100).round(1),
+        "month": np.tile(["January", "January", "January", "February", "February", "February"], size),
+        "year": 2024,
+    })
+
+    max_score = 100.0
+    score = (rng.beta(5, 3, rows) * max_score).round(1)
+    assessments = pd.DataFrame({
+        "student_id": np.repeat(ids, 6),
+        "subject": np.tile(["Mathematics", "Physics", "Chemistry"], size * 2),
+        "assessment_type": np.tile(["midterm", "midterm", "midterm", "final", "final", "final"], size),
+        "score": score,
+        "max_score": max_score,
+        "percentage": score,
+        "date": np.tile(pd.to_datetime(["2024-02-01"] * 3 + ["2024-05-01"] * 3).strftime("%Y-%m-%d"), size),
+        "attempt_number": rng.choice([1, 1, 1, 2, 3], rows),
+    })
+
+    fee_rows = size * 2
+    due = np.full(fee_rows, 50000.0)
+    paid = rng.choice([0.0, 25000.0, 50000.0], fee_rows, p=[0.15, 0.15, 0.7])
+    fees = pd.DataFrame({
+        "student_id": np.repeat(ids, 2),
+        "amount_due": due,
+        "amount_paid": paid,
+        "due_date": np.tile(["2024-01-15", "2024-07-15"], size),
+        "paid_date": np.where(paid >= due, "2024-01-10", ""),
+        "status": np.where(paid >= due, "paid", np.where(paid > 0, "partial", "overdue")),
+        "semester": np.tile([1, 2], size),
+    })
+    return {"students": students, "attendance": attendance, "assessments": assessments, "fees": fees}
+
+
+class EduPredictBenchmark:
+    def __init__(self, client, server, requests=200, analyze_samples=50):
+        self.client = client
+        self.server = server
+        self.requests = requests
+        self.analyze_samples = analyze_samples
+
+    def reset(self):
+        self.client.portal.call(self.server.client.drop_database, os.environ["DB_NAME"])
+        self.client.portal.call(self.server.bootstrap_indexes)
+
+    def timed(self, method, url, **kwargs):
+        started = time.perf_counter()
+        response = self.client.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}: {response.text[:300]}")
+        return elapsed, response
+
+    def bench_uploads(self, cohort):
+        """Stream each sheet as CSV and report rows per second."""
+        results = {}
+        for upload_type, frame in cohort.items():
+            body = frame.to_csv(index=False).encode()
+            elapsed, response = self.timed(
+                "POST", f"/api/upload/{upload_type}/stream",
+                files={"file": (f"{upload_type}.csv", io.BytesIO(body), "text/csv")},
+            )
+            result = response.json()
+            results[upload_type] = {
+                "rows": len(frame),
+                "inserted": result.get("inserted"),
+                "rejected": result.get("rejected"),
+                "seconds": round(elapsed, 3),
+                "rows_per_second": round(len(frame) / elapsed, 1),
+            }
+        return results
+
+    def bench_analysis(self, student_ids):
+        sample = student_ids[:self.analyze_samples]
+        results = {}
+        for llm_mode in ("never", "always"):
+            timings = [
+                self.timed("POST", f"/api/analyze/student/{student_id}?llm={llm_mode}&refresh=true")[0]
+                for student_id in sample
+            ]
+            results[f"llm_{llm_mode}"] = _percentiles(timings)
+        elapsed, response = self.timed("POST", "/api/analyze/score-all", json={})
+        results["score_all"] = {"seconds": round(elapsed, 3), "scored": response.json()["scored"]}
+        return results
+
+    def bench_reads(self):
+        endpoints = {
+            "dashboard_overview": "/api/dashboard/overview",
+            "at_risk": "/api/students/at-risk?limit=100",
+            "at_risk_high": "/api/students/at-risk?risk_level=HIGH&limit=100",
+            "notifications": "/api/notifications",
+        }
+        return {
+            name: _percentiles([self.timed("GET", url)[0] for _ in range(self.requests)])
+            for name, url in endpoints.items()
+        }
+
+    def run_cohort(self, size):
+        print(f"\n🔍 Cohort of {size} students")
+        self.reset()
+        cohort = generate_cohort(size)
+        result = {"students": size}
+        result["upload"] = self.bench_uploads(cohort)
+        print(f"   Upload: {json.dumps({name: r['rows_per_second'] for name, r in result['upload'].items()})} rows/s")
+        result["analyze"] = self.bench_analysis(cohort["students"]["student_id"].tolist())
+        print(f"   Analyze p95: never={result['analyze']['llm_never']['p95_ms']}ms "
+              f"always={result['analyze']['llm_always']['p95_ms']}ms, score-all {result['analyze']['score_all']['seconds']}s")
+        result["reads"] = self.bench_reads()
+        print("   Reads p95: " + ", ".join(f"{name}={r['p95_ms']}ms" for name, r in result["reads"].items()))
+        result["peak_rss_mb"] = _peak_rss_mb()
+        return result
+
+
+def run_cohort_process(size, args):
+    """Benchmark one cohort in a fresh interpreter and return its results."""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / "cohort.json"
+        command = [
+            sys.executable, str(Path(__file__).resolve()), "--sizes", str(size), "--output", str(output),
+            "--requests", str(args.requests), "--analyze-samples", str(args.analyze_samples),
+            "--llm-delay", str(args.llm_delay),
+        ]
+        if args.mongo_url:
+            command += ["--mongo-url", args.mongo_url]
+        subprocess.run(command, check=True)
+        return json.loads(output.read_text())["cohorts"][str(size)]
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline, tolerance):
+    """Print metrics that moved more than `tolerance`; returns regression count."""
+    regressions = 0
+    for size, cohort in current["cohorts"].items():
+        previous = baseline.get("cohorts", {}).get(size)
+        if not previous:
+            continue
+        now, before = _flatten(cohort), _flatten(previous)
+        for name in sorted(set(now) & set(before)):
+            higher_is_better = name.endswith("rows_per_second")
+            if not (name.endswith("_ms") or name.endswith("seconds") or higher_is_better or name.endswith("_mb")):
+                continue
+            if not before[name]:
+                continue
+            change = (now[name] - before[name]) / before[name]
+            worse = -change if higher_is_better else change
+            if worse > tolerance:
+                regressions += 1
+                print(f"❌ {size}/{name}: {before[name]} -> {now[name]} ({change:+.1%})")
+            elif worse < -tolerance:
+                print(f"✅ {size}/{name}: {before[name]} -> {now[name]} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated cohort sizes")
+    parser.add_argument("--requests", type=int, default=200, help="requests per read endpoint")
+    parser.add_argument("--analyze-samples", type=int, default=50, help="students analyzed per LLM mode")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="seconds the stubbed LLM takes to reply")
+    parser.add_argument("--mongo-url", default=None, help="use a real mongod instead of mongomock")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change reported as a regression")
+    args = parser.parse_args()
+
+    print("🚀 Starting EduPredict benchmark...")
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": "mongod" if args.mongo_url else "mongomock",
+            "llm_delay": args.llm_delay,
+            "requests": args.requests,
+            "analyze_samples": args.analyze_samples,
+        },
+        "cohorts": {},
+    }
+    if len(sizes) > 1:
+        # ru_maxrss only ever grows, so sharing a process would report the
+        # largest cohort so far instead of each cohort's own peak
+        for size in sizes:
+            results["cohorts"][str(size)] = run_cohort_process(size, args)
+    else:
+        server = load_app(args.mongo_url)
+        StubLlmChat.delay = args.llm_delay
+        # The server logs at INFO; per-request client logs would drown the report
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        from fastapi.testclient import TestClient
+
+        with TestClient(server.app) as client:
+            bench = EduPredictBenchmark(client, server, args.requests, args.analyze_samples)
+            for size in sizes:
+                results["cohorts"][str(size)] = bench.run_cohort(size)
+            bench.reset()
+
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"\n📊 Results written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"{regressions} regression(s) beyond {args.tolerance:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,12 @@ import requests
 import sys
 import json
 import io
+import asyncio
+import threading
+import time
 import pandas as pd
 from datetime import datetime, timedelta
+from pathlib import Path
 
 class EduPredictAPITester:
     def __init__(self, base_url="https://mentorview.preview.emergentagent.com"):
@@ -55,6 +59,17 @@ class EduPredictAPITester:
             print(f"❌ Failed - Error: {str(e)}")
             return False, {}
 
+    def run_local_test(self, name, check):
+        """Run an in-process check (an async function) that needs no server"""
+        self.tests_run += 1
+        print(f"\n🔍 Testing {name}...")
+        try:
+            asyncio.run(check())
+            self.tests_passed += 1
+            print("✅ Passed")
+        except Exception as e:
+            print(f"❌ Failed - {type(e).__name__}: {str(e)}")
+
     def create_test_excel_file(self, file_type):
         """Create test Excel files for different data types"""
         if file_type == "students":
@@ -127,6 +142,222 @@ class EduPredictAPITester:
             if not success:
                 print(f"⚠️  Upload {upload_type} failed - this may affect subsequent tests")
 
+    def test_bundle_upload(self):
+        """Test uploading several sheets at once as one workbook"""
+        print("\n" + "="*50)
+        print("TESTING BUNDLE UPLOAD")
+        print("="*50)
+
+        attendance = pd.read_excel(self.create_test_excel_file("attendance"))
+        # A row for a student that is in neither the bundle nor the database
+        attendance.loc[len(attendance)] = ['UNKNOWN999', 'Math', 20, 10, 50.0, 'January', 2024]
+        excel_buffer = io.BytesIO()
+        with pd.ExcelWriter(excel_buffer) as writer:
+            pd.read_excel(self.create_test_excel_file("students")).to_excel(writer, sheet_name='students', index=False)
+            attendance.to_excel(writer, sheet_name='attendance', index=False)
+            pd.read_excel(self.create_test_excel_file("fees")).to_excel(writer, sheet_name='fees', index=False)
+        excel_buffer.seek(0)
+        files = {'file': ('test_bundle.xlsx', excel_buffer, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')}
+
+        success, response = self.run_test(
+            "Upload Bundle",
+            "POST",
+            "upload/bundle?mode=upsert",
+            200,
+            files=files
+        )
+        if success:
+            rejected = response.get('sheets', {}).get('attendance', {}).get('rejected')
+            print(f"   Attendance rows rejected for unknown students: {rejected}")
+
+    def test_llm_resilience(self):
+        """Unit tests for the LLM circuit breaker and call pool (no server needed)"""
+        print("\n" + "="*50)
+        print("TESTING LLM CIRCUIT BREAKER AND POOL")
+        print("="*50)
+
+        sys.path.insert(0, str(Path(__file__).parent / "backend"))
+        try:
+            from llm_retry import CircuitBreaker, CircuitOpenError
+            from llm_pool import LlmPool
+        except ImportError as e:
+            self.tests_run += 1
+            print(f"❌ Failed - Cannot import backend modules: {str(e)}")
+            return
+
+        reset_after = 0.05
+
+        class FakeChat:
+            def __init__(self, outcome):
+                self.outcome = outcome
+
+            async def send_message(self, message):
+                if self.outcome == "fail":
+                    raise RuntimeError("provider error")
+                if self.outcome == "hang":
+                    await asyncio.sleep(10)
+                return '{"risk_level": "LOW"}'
+
+        def make_pool(timeout=1.0):
+            return LlmPool("test-key", "system", "openai", "test-model", timeout=timeout,
+                           breaker=CircuitBreaker(threshold=2, reset_after=reset_after))
+
+        def expect_open(breaker):
+            try:
+                breaker.check()
+            except CircuitOpenError:
+                return
+            raise AssertionError(f"breaker admitted a call while {breaker.state}")
+
+        async def breaker_opens():
+            breaker = CircuitBreaker(threshold=2, reset_after=reset_after)
+            assert breaker.check() is False
+            breaker.record_failure()
+            assert breaker.state == "closed"
+            breaker.record_failure()
+            assert breaker.state == "open" and breaker.times_opened == 1
+            expect_open(breaker)
+
+        async def half_open_admits_one_trial():
+            breaker = CircuitBreaker(threshold=1, reset_after=reset_after)
+            breaker.record_failure()
+            await asyncio.sleep(reset_after * 1.5)
+            assert breaker.state == "half-open"
+            assert breaker.check() is True
+            expect_open(breaker)
+
+        async def trial_success_closes():
+            breaker = CircuitBreaker(threshold=1, reset_after=reset_after)
+            breaker.record_failure()
+            await asyncio.sleep(reset_after * 1.5)
+            breaker.check()
+            breaker.record_success()
+            assert breaker.state == "closed" and not breaker.trial_running
+            assert breaker.check() is False
+
+        async def trial_failure_reopens():
+            breaker = CircuitBreaker(threshold=1, reset_after=reset_after)
+            breaker.record_failure()
+            await asyncio.sleep(reset_after * 1.5)
+            breaker.check()
+            breaker.record_failure()
+            assert breaker.state == "open" and breaker.times_opened == 2
+            expect_open(breaker)
+
+        async def cancelled_trial_is_released():
+            pool = make_pool()
+            for _ in range(2):
+                try:
+                    await pool.send(FakeChat("fail"), "prompt")
+                except RuntimeError:
+                    pass
+            await asyncio.sleep(reset_after * 1.5)
+            task = asyncio.create_task(pool.send(FakeChat("hang"), "prompt"))
+            await asyncio.sleep(0.01)
+            assert pool.breaker.trial_running
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            assert pool.breaker.state == "half-open" and not pool.breaker.trial_running
+            await pool.send(FakeChat("ok"), "prompt")
+            assert pool.breaker.state == "closed"
+
+        async def pool_full_cycle():
+            pool = make_pool()
+            assert await pool.send(FakeChat("ok"), "prompt")
+            for _ in range(2):
+                try:
+                    await pool.send(FakeChat("fail"), "prompt")
+                except RuntimeError:
+                    pass
+            assert pool.breaker.state == "open"
+            try:
+                await pool.send(FakeChat("ok"), "prompt")
+                raise AssertionError("send went through an open circuit")
+            except CircuitOpenError:
+                pass
+            await asyncio.sleep(reset_after * 1.5)
+            assert pool.breaker.state == "half-open"
+            # Several sends in a row: the first is the trial and closes the circuit
+            for _ in range(3):
+                await pool.send(FakeChat("ok"), "prompt")
+            assert pool.breaker.state == "closed"
+            assert pool.stats()["rejected"] == 1
+
+        async def pool_send_times_out():
+            pool = make_pool(timeout=0.05)
+            started = time.perf_counter()
+            try:
+                await pool.send(FakeChat("hang"), "prompt")
+                raise AssertionError("send did not time out")
+            except TimeoutError:
+                pass
+            assert time.perf_counter() - started < 1.0
+            stats = pool.stats()
+            assert stats["timeouts"] == 1 and stats["in_flight"] == 0
+            assert pool.breaker.failures == 1
+
+        self.run_local_test("Breaker Opens After Threshold", breaker_opens)
+        self.run_local_test("Half-Open Breaker Admits One Trial", half_open_admits_one_trial)
+        self.run_local_test("Trial Success Closes Breaker", trial_success_closes)
+        self.run_local_test("Trial Failure Re-opens Breaker", trial_failure_reopens)
+        self.run_local_test("Cancelled Trial Is Released", cancelled_trial_is_released)
+        self.run_local_test("Pool Closed -> Open -> Half-Open -> Closed", pool_full_cycle)
+        self.run_local_test("Pool Send Times Out", pool_send_times_out)
+
+    def test_event_loop_latency_during_upload(self, rows=40000, max_p95_seconds=0.5):
+        """Dashboard requests stay fast while a large workbook is being parsed"""
+        print("\n" + "="*50)
+        print("TESTING EVENT LOOP LATENCY DURING A LARGE UPLOAD")
+        print("="*50)
+
+        # Every row lacks a student_id, so the whole sheet is parsed and validated but nothing is written
+        df = pd.DataFrame({
+            'student_id': [''] * rows,
+            'subject': ['Mathematics'] * rows,
+            'total_classes': [30] * rows,
+            'attended_classes': [20] * rows,
+            'attendance_percentage': [66.7] * rows,
+            'month': ['January'] * rows,
+            'year': [2024] * rows
+        })
+        excel_buffer = io.BytesIO()
+        df.to_excel(excel_buffer, index=False)
+        excel_buffer.seek(0)
+
+        upload = {}
+
+        def run_upload():
+            files = {'file': ('large_attendance.xlsx', excel_buffer, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')}
+            upload['response'] = requests.post(f"{self.api_url}/upload/attendance", files=files)
+
+        self.tests_run += 1
+        print(f"\n🔍 Testing Dashboard Latency While Uploading {rows} Rows...")
+        uploader = threading.Thread(target=run_upload)
+        uploader.start()
+        latencies = []
+        while uploader.is_alive():
+            started = time.perf_counter()
+            requests.get(f"{self.api_url}/dashboard/overview")
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.05)
+        uploader.join()
+
+        response = upload.get('response')
+        if response is None or response.status_code != 200 or not latencies:
+            print(f"❌ Failed - Upload did not complete: {response.status_code if response is not None else 'no response'}")
+            return
+        latencies.sort()
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        print(f"   {len(latencies)} dashboard requests during the upload: p50 {latencies[len(latencies) // 2]:.3f}s, p95 {p95:.3f}s, max {latencies[-1]:.3f}s")
+        if p95 <= max_p95_seconds:
+            self.tests_passed += 1
+            print(f"✅ Passed - p95 latency within {max_p95_seconds}s")
+        else:
+            print(f"❌ Failed - p95 latency above {max_p95_seconds}s; uploads are blocking the event loop")
+
     def test_dashboard_endpoints(self):
         """Test dashboard-related endpoints"""
         print("\n" + "="*50)
@@ -216,6 +447,29 @@ class EduPredictAPITester:
         else:
             print("⚠️  No notifications found to test management features")
 
+        self.run_test(
+            "Unread Notification Counts",
+            "GET",
+            "notifications/unread-counts",
+            200
+        )
+
+        self.run_test(
+            "Bulk Mark Notifications as Read",
+            "PUT",
+            "notifications/read",
+            200,
+            data={"student_id": self.test_student_id}
+        )
+
+        self.run_test(
+            "Bulk Mark Read Without Filter",
+            "PUT",
+            "notifications/read",
+            400,
+            data={}
+        )
+
     def test_error_handling(self):
         """Test error handling scenarios"""
         print("\n" + "="*50)
@@ -249,7 +503,10 @@ def main():
     tester = EduPredictAPITester()
     
     # Test sequence
+    tester.test_llm_resilience()
     tester.test_file_uploads()
+    tester.test_bundle_upload()
+    tester.test_event_loop_latency_during_upload()
     tester.test_dashboard_endpoints()
     tester.test_ai_analysis()
     tester.test_notification_management()